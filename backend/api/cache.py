@@ -0,0 +1,260 @@
+import time
+from collections import namedtuple
+from hashlib import sha256
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from recipes.models import Ingredient, ShoppingCart, Tag
+
+VERSION_KEY = 'version:{name}'
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+USER_VERSION = 'user:{user_id}'
+RECIPES_VERSION = 'recipes'
+RECIPE_INGREDIENTS_VERSION = 'recipe_ingredients'
+SHOPPING_LIST_DIGEST_KEY = (
+    'shopping_list:digest:{user_id}:{ingredients_version}'
+)
+SHOPPING_LIST_FILE_KEY = 'shopping_list:file:{digest}:{file_format}'
+FEED_TIMELINE_KEY = 'feed:{user_id}:{user_version}:{recipes_version}'
+
+
+def shopping_list_digest(annotated_results):
+    """
+    Хэш агрегированного списка покупок: ингредиент, его название,
+    единица измерения и суммарное количество.
+    """
+    hasher = sha256()
+    for item in annotated_results:
+        hasher.update(
+            f'{item.id}:{item.name}:{item.measurement_unit}:'
+            f'{item.sum_ingredients};'.encode()
+        )
+    return hasher.hexdigest()
+
+
+def get_shopping_list_digest(user, annotated_results):
+    """
+    Хэш списка покупок пользователя. Хэш хранится в кэше до изменения
+    корзины пользователя или справочника ингредиентов, поэтому агрегация
+    выполняется только после изменений.
+    """
+    key = SHOPPING_LIST_DIGEST_KEY.format(
+        user_id=user.id, ingredients_version=get_version(INGREDIENTS_VERSION)
+    )
+    digest = cache.get(key)
+    if digest is None:
+        digest = shopping_list_digest(annotated_results)
+        cache.set(key, digest, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return digest
+
+
+def get_shopping_list_file(digest, file_format):
+    """Получение готового файла списка покупок из кэша."""
+    return cache.get(SHOPPING_LIST_FILE_KEY.format(
+        digest=digest, file_format=file_format
+    ))
+
+
+def cache_shopping_list_file(content, digest, file_format):
+    """
+    Сохранение файла списка покупок в кэш по мере отдачи клиенту.
+    Файлы больше SHOPPING_LIST_CACHE_MAX_SIZE не кэшируются.
+    """
+    chunks = []
+    size = 0
+    for chunk in content:
+        if chunks is not None:
+            size += len(chunk)
+            if size > settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                chunks = None
+            else:
+                chunks.append(chunk)
+        yield chunk
+    if chunks is not None:
+        cache.set(
+            SHOPPING_LIST_FILE_KEY.format(
+                digest=digest, file_format=file_format
+            ),
+            b''.join(chunks),
+            settings.SHOPPING_LIST_CACHE_TIMEOUT,
+        )
+
+
+def invalidate_shopping_lists(user_ids):
+    """Сброс хэшей списков покупок пользователей."""
+    ingredients_version = get_version(INGREDIENTS_VERSION)
+    cache.delete_many([
+        SHOPPING_LIST_DIGEST_KEY.format(
+            user_id=user_id, ingredients_version=ingredients_version
+        )
+        for user_id in user_ids
+    ])
+
+
+def invalidate_recipe_shopping_lists(recipe_id):
+    """Сброс хэшей списков покупок пользователей с рецептом в корзине."""
+    invalidate_shopping_lists(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+    )
+
+
+def get_version(name):
+    """
+    Текущая версия набора данных name.
+    Начальная версия берется от времени, чтобы не повторять версии,
+    выданные до очистки кэша.
+    """
+    return cache.get_or_set(
+        VERSION_KEY.format(name=name),
+        lambda: int(time.time() * 1000),
+        None,
+    )
+
+
+def bump_version(name):
+    """Смена версии набора данных name при его изменении."""
+    key = VERSION_KEY.format(name=name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_version(name)
+
+
+def bump_version_on_commit(name):
+    """
+    Смена версии набора данных name сразу и повторно после фиксации
+    транзакции: значение, вычисленное другим процессом по данным до
+    фиксации, остается под промежуточной версией и не используется.
+    """
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def bump_model_version(model):
+    """
+    Смена версии справочника после массового изменения данных модели
+    в обход сигналов.
+    """
+    name = {Tag: TAGS_VERSION, Ingredient: INGREDIENTS_VERSION}.get(model)
+    if name is not None:
+        bump_version(name)
+
+
+def get_feed_timeline(user, build):
+    """
+    Лента рецептов пользователя из кэша. Лента пересчитывается функцией
+    build при изменении подписок пользователя и при публикации
+    или удалении рецептов.
+    """
+    return cache.get_or_set(
+        FEED_TIMELINE_KEY.format(
+            user_id=user.id,
+            user_version=get_version(USER_VERSION.format(user_id=user.id)),
+            recipes_version=get_version(RECIPES_VERSION),
+        ),
+        build,
+        settings.FEED_TIMELINE_CACHE_TIMEOUT,
+    )
+
+
+def recipes_etag(request, last_modified, count):
+    """
+    ETag выдачи рецептов: зависит от даты последнего изменения,
+    количества рецептов выборки, их добавлений в избранное и рейтинга
+    популярности (или рецептов страницы курсорной пагинации), параметров
+    запроса, версий справочников, версии избранного, корзины и подписок
+    текущего пользователя.
+    """
+    user = request.user
+    user_version = (
+        None if user.is_anonymous
+        else get_version(USER_VERSION.format(user_id=user.id))
+    )
+    validators = (
+        last_modified, count, request.get_full_path(), user.id, user_version,
+        get_version(TAGS_VERSION), get_version(INGREDIENTS_VERSION),
+    )
+    return quote_etag(sha256(repr(validators).encode()).hexdigest())
+
+
+SerializedData = namedtuple(
+    'SerializedData', ('content', 'etag', 'last_modified')
+)
+
+
+def serialized_data(content):
+    """Сериализованные данные с валидаторами для условных запросов."""
+    return SerializedData(
+        content=content,
+        etag=quote_etag(sha256(content).hexdigest()),
+        last_modified=int(time.time()),
+    )
+
+
+class ProcessLocalCache:
+    """
+    Значение, хранящееся в памяти процесса.
+    Значение пересчитывается при смене версии набора данных version_name
+    и не реже, чем раз в REFERENCE_DATA_CACHE_TIMEOUT секунд: при
+    локальном для процесса бэкенде кэша другие процессы не видят смену
+    версии.
+    """
+
+    def __init__(self, version_name):
+        self.version_name = version_name
+        self._lock = Lock()
+        self._entry = None
+
+    def _is_actual(self, entry, version):
+        return (
+            entry is not None
+            and entry[0] == version
+            and time.monotonic() - entry[1]
+            < settings.REFERENCE_DATA_CACHE_TIMEOUT
+        )
+
+    def get(self, build):
+        """
+        Получение значения, build - функция, вычисляющая значение при
+        устаревании кэша.
+        """
+        version = get_version(self.version_name)
+        entry = self._entry
+        if not self._is_actual(entry, version):
+            with self._lock:
+                entry = self._entry
+                if not self._is_actual(entry, version):
+                    entry = (version, time.monotonic(), build())
+                    self._entry = entry
+        return entry[2]
+
+
+tags_cache = ProcessLocalCache(TAGS_VERSION)
+tag_ids_cache = ProcessLocalCache(TAGS_VERSION)
+ingredients_cache = ProcessLocalCache(INGREDIENTS_VERSION)
+
+
+def get_tag_ids(slugs):
+    """
+    Идентификаторы тэгов по слагам из хранящегося в памяти процесса
+    соответствия слаг - идентификатор. Слаги, которых нет в соответствии,
+    проверяются запросом к базе данных: тэг мог быть создан до смены
+    версии. Неизвестные слаги пропускаются.
+    """
+    tag_ids = tag_ids_cache.get(
+        lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
+    missing = [slug for slug in slugs if slug not in tag_ids]
+    found = [tag_ids[slug] for slug in slugs if slug in tag_ids]
+    if missing:
+        found.extend(Tag.objects.filter(
+            slug__in=missing
+        ).values_list('id', flat=True))
+    return found
@@ -0,0 +1,124 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def change_counters(source, objs, delta):
+    """
+    Изменение счетчиков, зависящих от объектов objs модели source,
+    на delta для каждого объекта. Счетчики обновляются выражением F()
+    в базе данных и не уходят ниже нуля.
+    """
+    for model, field, counted_model, fk in COUNTERS:
+        if counted_model is not source:
+            continue
+        pks = {}
+        for obj in objs:
+            pk = getattr(obj, f'{fk}_id')
+            pks[pk] = pks.get(pk, 0) + delta
+        for change in set(pks.values()):
+            queryset = model.objects.filter(pk__in=[
+                pk for pk, pk_change in pks.items() if pk_change == change
+            ])
+            if change < 0:
+                queryset = queryset.filter(**{f'{field}__gte': -change})
+            queryset.update(**{field: F(field) + change})
+
+
+def actual_count(counted_model, fk):
+    """Выражение с фактическим количеством связанных объектов."""
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(
+                **{fk: OuterRef('pk')}
+            ).order_by().values(fk).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def reconcile_counters(batch_size=1000):
+    """
+    Пересчет разошедшихся с фактическими данными счетчиков.
+    Для каждого счетчика возвращает модель, поле и число исправленных
+    объектов.
+    """
+    for model, field, counted_model, fk in COUNTERS:
+        pks = list(
+            model.objects.annotate(
+                actual=actual_count(counted_model, fk)
+            ).exclude(
+                **{field: F('actual')}
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(pks), batch_size):
+            model.objects.filter(
+                pk__in=pks[start:start + batch_size]
+            ).update(**{field: actual_count(counted_model, fk)})
+        yield model, field, len(pks)
+
+
+def trending_scores(now):
+    """
+    Рейтинг рецептов за последние TRENDING_WINDOW_DAYS дней: каждое
+    добавление в избранное и корзину учитывается с весом из
+    TRENDING_WEIGHTS, который убывает вдвое каждые
+    TRENDING_HALF_LIFE_HOURS часов.
+    """
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    scores = defaultdict(float)
+    for model, weight in (
+        (Favorite, settings.TRENDING_WEIGHTS['favorite']),
+        (ShoppingCart, settings.TRENDING_WEIGHTS['shopping_cart']),
+    ):
+        for recipe_id, created in model.objects.filter(
+            created__gte=since
+        ).values_list('recipe_id', 'created').iterator():
+            age = (now - created).total_seconds()
+            scores[recipe_id] += weight * 0.5 ** (age / half_life)
+    return scores
+
+
+def update_trending_scores(batch_size=1000, now=None):
+    """
+    Сохранение рейтинга рецептов в Recipe.trending_score. Обновляются
+    только рецепты с изменившимся рейтингом, рецепты вне окна получают
+    нулевой рейтинг. Возвращает число обновленных рецептов.
+    """
+    scores = {
+        recipe_id: round(score, 6)
+        for recipe_id, score in trending_scores(now or timezone.now()).items()
+    }
+    current = dict(
+        Recipe.objects.filter(trending_score__gt=0).order_by().values_list(
+            'pk', 'trending_score'
+        ).iterator()
+    )
+    for pk in current:
+        scores.setdefault(pk, 0)
+    recipes = [
+        Recipe(pk=pk, trending_score=score) for pk, score in scores.items()
+        if current.get(pk, 0) != score
+    ]
+    Recipe.objects.bulk_update(recipes, ('trending_score',), batch_size)
+    return len(recipes)
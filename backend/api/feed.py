@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+from api.cache import get_feed_timeline
+from api.pagination import cursor_position
+from recipes.models import Recipe
+from users.models import Subscribe
+
+
+def subscribed_recipes(queryset, user):
+    """Рецепты выборки queryset авторов, на которых подписан пользователь."""
+    return queryset.filter(author_id__in=Subscribe.objects.filter(
+        user=user
+    ).values('author_id'))
+
+
+def build_feed_timeline(user):
+    """
+    Первые FEED_TIMELINE_SIZE рецептов ленты пользователя: идентификаторы
+    и дата публикации последнего рецепта, если лента обрезана.
+    """
+    rows = list(
+        subscribed_recipes(Recipe.objects.all(), user).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_TIMELINE_SIZE + 1]
+    )
+    if len(rows) <= settings.FEED_TIMELINE_SIZE:
+        return [pk for pk, _ in rows], None
+    rows = rows[:settings.FEED_TIMELINE_SIZE]
+    return [pk for pk, _ in rows], rows[-1][1]
+
+
+def get_feed_timeline_ids(user, cursor):
+    """
+    Идентификаторы рецептов ленты из кэша для пользователей, подписанных
+    более чем на FEED_TIMELINE_MIN_SUBSCRIPTIONS авторов, и признак
+    того, что кэшированная лента обрезана.
+    Возвращает None, если ленту нужно получать запросом к рецептам:
+    подписок немного либо курсор ушел дальше кэшированной ленты.
+    """
+    if (user.subscriber.count()
+            <= settings.FEED_TIMELINE_MIN_SUBSCRIPTIONS):
+        return None
+    ids, tail = get_feed_timeline(user, lambda: build_feed_timeline(user))
+    if tail is None:
+        return ids, False
+    position = cursor_position(cursor)
+    try:
+        position = position and parse_datetime(position[0])
+    except ValueError:
+        raise NotFound(CursorPagination.invalid_cursor_message)
+    if position is None or position > tail:
+        return ids, True
+    return None
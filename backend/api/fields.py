@@ -0,0 +1,106 @@
+import binascii
+import io
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from PIL import Image
+from rest_framework import serializers
+
+BASE64_CHUNK_SIZE = 64 * 1024
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """
+    Изображение в base64 (в том числе data URI).
+    Строка декодируется частями прямо во временный файл: в памяти не
+    держится вторая полная копия изображения, а слишком большие
+    изображения отклоняются по длине строки еще до декодирования.
+    Файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся на диск, как и при
+    обычной загрузке файлов.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Загрузите изображение в base64.',
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+        'max_pixels': (
+            'Изображение не должно быть больше {max_pixels} пикселей.'
+        ),
+        'invalid_format': (
+            'Допустимые форматы изображения: {formats}.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_base64')
+        start = data.find(';base64,', 0, 256)
+        start = 0 if start == -1 else start + len(';base64,')
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        # Длина base64 без переносов строк, которыми размечают каждые
+        # 76 символов, не больше 4/3 от размера файла.
+        if (len(data) - start) * 76 // 78 > (max_size + 2) // 3 * 4:
+            self.fail('max_size', max_size=max_size)
+        file = self.decode(data, start, max_size)
+        try:
+            image = Image.open(file)
+            image_format = (image.format or '').lower()
+            pixels = image.width * image.height
+        except (OSError, Image.DecompressionBombError):
+            file.close()
+            self.fail('invalid_image')
+        if image_format not in settings.RECIPE_IMAGE_FORMATS:
+            file.close()
+            self.fail('invalid_format', formats=', '.join(
+                settings.RECIPE_IMAGE_FORMATS
+            ))
+        if pixels > settings.RECIPE_IMAGE_MAX_PIXELS:
+            file.close()
+            self.fail('max_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        file.seek(0)
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        file.name = f'{uuid.uuid4()}.{extension}'
+        file.content_type = Image.MIME.get(image.format)
+        return super().to_internal_value(file)
+
+    def decode(self, data, start, max_size):
+        """
+        Декодирование base64 частями по BASE64_CHUNK_SIZE символов.
+        Неполная четверка символов в конце части переносится в следующую.
+        """
+        size_hint = (len(data) - start) // 4 * 3
+        if size_hint > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile('image', None, 0, None)
+        else:
+            file = InMemoryUploadedFile(
+                io.BytesIO(), None, 'image', None, 0, None
+            )
+        rest = ''
+        size = 0
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = rest + WHITESPACE_RE.sub(
+                    '', data[position:position + BASE64_CHUNK_SIZE]
+                )
+                end = len(chunk) // 4 * 4
+                decoded = binascii.a2b_base64(chunk[:end])
+                rest = chunk[end:]
+                size += len(decoded)
+                if size > max_size:
+                    break
+                file.write(decoded)
+            valid = not rest
+        except ValueError:
+            valid = False
+        if size > max_size:
+            file.close()
+            self.fail('max_size', max_size=max_size)
+        if not valid:
+            file.close()
+            self.fail('invalid_base64')
+        file.size = size
+        file.seek(0)
+        return file
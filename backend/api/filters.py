@@ -1,30 +1,145 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as django_filters
 
-from recipes.models import Recipe, Tag
+from api.cache import get_tag_ids
+from api.search import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingCart
 
 User = get_user_model()
 
+ORDERINGS = {
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+    'cooking_time': ('cooking_time', 'id'),
+    '-cooking_time': ('-cooking_time', '-id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'pub_date': ('pub_date', 'id'),
+    '-pub_date': ('-pub_date', '-id'),
+}
+
+USER_FLAGS = {
+    'is_favorited': Favorite,
+    'is_in_shopping_cart': ShoppingCart,
+}
+
+
+class SlugsField(forms.Field):
+    """Список слагов из повторяющегося параметра запроса."""
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [str(slug) for slug in value or ()]
+
+
+class SlugsFilter(django_filters.Filter):
+    """Фильтр по списку слагов без проверки их по базе данных."""
+    field_class = SlugsField
+
 
 class RecipeFilter(django_filters.FilterSet):
     """Фильтерсет рецептов."""
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = SlugsFilter(method='filter_tags')
+    tags_mode = django_filters.ChoiceFilter(
+        choices=(
+            ('any', 'Хотя бы один из тэгов'),
+            ('all', 'Все тэги'),
+        ),
+        method='skip_filter',
     )
     author = django_filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = django_filters.BooleanFilter(method='get_queryset')
     is_in_shopping_cart = django_filters.BooleanFilter(method='get_queryset')
+    cooking_time_min = django_filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte'
+    )
+    cooking_time_max = django_filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte'
+    )
+    search = django_filters.CharFilter(method='search_queryset')
+    ordering = django_filters.ChoiceFilter(
+        choices=(
+            ('popular', 'По количеству добавлений в избранное'),
+            ('trending', 'По популярности за последнее время'),
+            ('cooking_time', 'Сначала быстрые'),
+            ('-cooking_time', 'Сначала долгие'),
+            ('name', 'По названию'),
+            ('-name', 'По названию в обратном порядке'),
+            ('pub_date', 'Сначала старые'),
+            ('-pub_date', 'Сначала новые'),
+        ),
+        method='order_queryset',
+    )
 
     def get_queryset(self, queryset, name, value):
-        """Метод получения queryset при фильтрации по параметрам запроса."""
-        if name == 'is_favorited':
-            return queryset.filter(favorite__user=self.request.user)
-        if name == 'is_in_shopping_cart':
-            return queryset.filter(shopping_cart__user=self.request.user)
+        """
+        Метод получения queryset при фильтрации по параметрам запроса.
+        Фильтрация выполняется подзапросом EXISTS по индексу
+        (user, recipe) избранного или корзины.
+        """
+        user = self.request.user
+        if name not in USER_FLAGS:
+            return queryset
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        exists = Exists(USER_FLAGS[name].objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(exists if value else ~exists)
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тэгов или, при tags_mode=all, со всеми
+        тэгами. Слаги переводятся в идентификаторы без запроса к базе
+        данных, фильтрация - подзапросами EXISTS по индексу таблицы
+        связи рецептов и тэгов вместо соединения с DISTINCT.
+        """
+        if not value:
+            return queryset
+        slugs = set(value)
+        tag_ids = get_tag_ids(slugs)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            if len(tag_ids) < len(slugs):
+                return queryset.none()
+            groups = [[tag_id] for tag_id in tag_ids]
+        else:
+            if not tag_ids:
+                return queryset.none()
+            groups = [tag_ids]
+        for group in groups:
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'), tag_id__in=group
+                )
+            ))
         return queryset
 
+    def skip_filter(self, queryset, name, value):
+        """Параметр, который учитывается другими фильтрами."""
+        return queryset
+
+    def search_queryset(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию и описанию с сортировкой по
+        релевантности, если не задан параметр ordering.
+        """
+        return search_recipes(queryset, value)
+
+    def order_queryset(self, queryset, name, value):
+        """
+        Сортировка рецептов по заранее рассчитанным счетчику избранного
+        и рейтингу популярности, времени приготовления, названию или дате
+        публикации. Каждая сортировка, в том числе вместе с фильтром по
+        автору, покрыта индексом с идентификатором в конце.
+        """
+        return queryset.order_by(*ORDERINGS[value])
+
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'tags_mode', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'cooking_time_min', 'cooking_time_max',
+            'search', 'ordering',
+        )
@@ -1,8 +1,190 @@
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination, _reverse_ordering)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     """Стандартный пагинатор с пользовательским разбиением страниц."""
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+
+
+def cursor_position(cursor):
+    """
+    Значения полей сортировки из позиции курсора или None для курсора
+    без позиции.
+    """
+    if cursor is None or cursor.position is None:
+        return None
+    try:
+        position = json.loads(cursor.position)
+    except ValueError:
+        position = None
+    if (not isinstance(position, list) or not position
+            or not all(isinstance(value, str) for value in position)):
+        raise NotFound(CursorPagination.invalid_cursor_message)
+    return position
+
+
+def position_values(queryset, ordering, position):
+    """
+    Значения позиции курсора, приведенные к типам полей сортировки
+    выборки. Для значений, которые не приводятся, курсор недействителен.
+    """
+    if len(position) != len(ordering):
+        raise NotFound(CursorPagination.invalid_cursor_message)
+    values = []
+    for order, value in zip(ordering, position):
+        field = queryset.query.resolve_ref(order.lstrip('-')).output_field
+        try:
+            values.append(field.get_prep_value(field.to_python(value)))
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(CursorPagination.invalid_cursor_message)
+    return values
+
+
+def keyset_filter(ordering, position, reverse):
+    """
+    Условие на объекты, следующие за позицией position в порядке
+    ordering (при reverse - предшествующие ей): лексикографическое
+    сравнение по всем полям сортировки и условие по первому полю,
+    ограничивающее диапазон просмотра индекса.
+    """
+    condition = Q()
+    equal = {}
+    for order, value in zip(ordering, position):
+        field = order.lstrip('-')
+        lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    field = ordering[0].lstrip('-')
+    lookup = 'lte' if reverse != ordering[0].startswith('-') else 'gte'
+    return Q(**{f'{field}__{lookup}': position[0]}) & condition
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Курсорный (keyset) пагинатор: страница выбирается условием по полям
+    сортировки без OFFSET и без подсчета общего количества объектов.
+    Сортировка берется из выборки, если ее задал фильтр, иначе из
+    атрибута cursor_ordering вьюсета, и дополняется первичным ключом.
+    Позиция курсора содержит значения всех полей сортировки, поэтому
+    страницы внутри группы объектов с равным первым полем тоже
+    выбираются условием, а не смещением.
+    """
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    ordering = ('-pk',)
+
+    def get_ordering(self, request, queryset, view):
+        if queryset.query.order_by:
+            ordering = tuple(queryset.query.order_by)
+        else:
+            ordering = tuple(getattr(view, 'cursor_ordering', self.ordering))
+        if ordering[-1].lstrip('-') not in ('pk', 'id'):
+            ordering += ('-pk' if ordering[-1].startswith('-') else 'pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        position = cursor_position(self.cursor)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(
+                self.ordering,
+                position_values(queryset, self.ordering, position),
+                reverse,
+            ))
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        has_current = current_position is not None or offset > 0
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = (
+                has_current, following_position is not None
+            )
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next, self.has_previous = (
+                following_position is not None, has_current
+            )
+            self.next_position = following_position
+            self.previous_position = current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([
+            str(
+                instance[order.lstrip('-')] if isinstance(instance, dict)
+                else getattr(instance, order.lstrip('-'))
+            )
+            for order in ordering
+        ])
+
+
+class LimitPageNumberOrCursorPagination(BasePagination):
+    """
+    Пагинатор, по умолчанию разбивающий выдачу на страницы по номеру.
+    При наличии в запросе параметра cursor (в том числе пустого для
+    первой страницы) используется курсорная пагинация.
+    """
+    page_number_pagination_class = LimitPageNumberPagination
+    cursor_pagination_class = LimitCursorPagination
+
+    def __init__(self):
+        self.paginator = self.page_number_pagination_class()
+
+    def is_cursor_request(self, request):
+        return (
+            self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_request(request):
+            self.paginator = self.cursor_pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_fields(self, view):
+        return (
+            self.page_number_pagination_class().get_schema_fields(view)
+            + self.cursor_pagination_class().get_schema_fields(view)[:1]
+        )
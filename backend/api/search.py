@@ -0,0 +1,291 @@
+import re
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (BooleanField, Case, F, FloatField, IntegerField,
+                              Max, Value, When)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from api.cache import (INGREDIENTS_VERSION, RECIPE_INGREDIENTS_VERSION,
+                       ProcessLocalCache, get_version)
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Названия хранятся отсортированными в нижнем регистре, совпадения
+    по началу названия находятся бинарным поиском.
+    Индекс перестраивается при смене версии справочника ингредиентов.
+    """
+
+    def __init__(self):
+        self._cache = ProcessLocalCache(INGREDIENTS_VERSION)
+
+    def _build(self):
+        items = sorted(
+            (
+                (name.lower(), pk), {
+                    'id': pk, 'name': name,
+                    'measurement_unit': measurement_unit,
+                }
+            )
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        return [key for key, _ in items], [item for _, item in items]
+
+    def search(self, query, limit):
+        """
+        Поиск ингредиентов: сначала совпадения по началу названия,
+        затем по вхождению в название, не более limit результатов.
+        """
+        keys, items = self._cache.get(self._build)
+        query = query.lower()
+        start = bisect_left(keys, (query,))
+        result = []
+        end = start
+        while (
+            end < len(keys) and len(result) < limit
+            and keys[end][0].startswith(query)
+        ):
+            result.append(items[end])
+            end += 1
+        if len(result) < limit:
+            for index, (name, _) in enumerate(keys):
+                if start <= index < end or query not in name:
+                    continue
+                result.append(items[index])
+                if len(result) == limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients_in_database(query, limit):
+    """
+    Поиск ингредиентов запросом к базе данных с тем же ранжированием.
+    Использует индекс по lower(name), на PostgreSQL - триграммный.
+    """
+    query = query.lower()
+    return list(
+        Ingredient.objects.annotate(
+            name_lower=Lower('name'),
+        ).filter(
+            name_lower__contains=query,
+        ).annotate(
+            rank=Case(
+                When(name_lower__startswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('rank', 'name_lower', 'id').values(
+            'id', 'name', 'measurement_unit'
+        )[:limit]
+    )
+
+
+def search_ingredients(query, limit=None):
+    """Поиск ингредиентов для автодополнения по названию."""
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    if settings.INGREDIENT_SEARCH_BACKEND == 'database':
+        return search_ingredients_in_database(query, limit)
+    return ingredient_index.search(query, limit)
+
+
+WORD_RE = re.compile(r'\w+')
+
+POSTGRESQL_MATCH_SQL = (
+    "recipes_recipe.search_vector @@ websearch_to_tsquery('russian', %s)"
+)
+POSTGRESQL_RANK_SQL = (
+    'ts_rank(recipes_recipe.search_vector, '
+    "websearch_to_tsquery('russian', %s))"
+)
+
+
+def fts5_query(query):
+    """
+    Запрос FTS5 из слов строки поиска: все слова по началу, так как у
+    SQLite нет русской морфологии. Синтаксис FTS5 в строке поиска
+    не используется.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query.lower()))
+
+
+def search_recipes(queryset, query):
+    """
+    Полнотекстовый поиск рецептов по названию и описанию по индексу
+    из миграции recipes.0012_recipe_search: на PostgreSQL - по столбцу
+    search_vector, на SQLite - соединением с таблицей FTS5. Рецепты
+    аннотируются релевантностью search_rank (совпадения в названии
+    весят больше) и сортируются по ней.
+    """
+    if connection.vendor != 'postgresql':
+        query = fts5_query(query)
+        if not query:
+            return queryset.none()
+        return queryset.filter(search_index__document__match=query).annotate(
+            search_rank=-F('search_index__rank')
+        ).order_by('-search_rank', '-id')
+    if not query.strip():
+        return queryset.none()
+    return queryset.filter(
+        RawSQL(POSTGRESQL_MATCH_SQL, (query,), output_field=BooleanField())
+    ).annotate(
+        search_rank=RawSQL(
+            POSTGRESQL_RANK_SQL, (query,), output_field=FloatField()
+        )
+    ).order_by('-search_rank', '-id')
+
+
+RECIPE_INDEX_OVERLAP = timedelta(minutes=1)
+
+RecipeIngredientSnapshot = namedtuple('RecipeIngredientSnapshot', (
+    'version', 'checked_at', 'last_updated', 'recipe_ids', 'compositions',
+    'postings', 'rows',
+))
+
+
+class RecipeIngredientIndex:
+    """
+    Инвертированный индекс в памяти процесса для поиска рецептов по
+    имеющимся ингредиентам: ингредиент - отсортированный массив
+    идентификаторов рецептов с ним, рецепт - его ингредиенты.
+    Индекс строится из IngredientInRecipe при первом обращении. При
+    смене версии состава рецептов (и не реже, чем раз в
+    REFERENCE_DATA_CACHE_TIMEOUT секунд) он обновляется инкрементально:
+    перечитываются рецепты, измененные с прошлого обновления, с запасом
+    RECIPE_INDEX_OVERLAP на позже зафиксированные транзакции, и новые
+    рецепты. Удаленные рецепты находятся сравнением идентификаторов
+    всех рецептов со снимком. Удаление ингредиента каскадом удаляет
+    строки составов, не меняя рецепты, поэтому снимок хранит число
+    строк IngredientInRecipe, и при расхождении с базой после
+    обновления индекс строится заново. Обновление собирает новый снимок
+    индекса, поиск по текущему снимку идет без блокировок.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+
+    def _build(self, version):
+        last_updated = Recipe.objects.aggregate(
+            last_updated=Max('updated_at')
+        )['last_updated']
+        compositions = defaultdict(list)
+        postings = defaultdict(lambda: array('q'))
+        rows = IngredientInRecipe.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        count = 0
+        for recipe_id, ingredient_id in rows.iterator():
+            compositions[recipe_id].append(ingredient_id)
+            postings[ingredient_id].append(recipe_id)
+            count += 1
+        return RecipeIngredientSnapshot(
+            version, time.monotonic(), last_updated,
+            frozenset(Recipe.objects.values_list('id', flat=True)),
+            {pk: tuple(items) for pk, items in compositions.items()},
+            dict(postings), count,
+        )
+
+    def _refresh(self, snapshot, version):
+        if snapshot.last_updated is None:
+            return self._build(version)
+        recipe_ids = frozenset(Recipe.objects.values_list('id', flat=True))
+        updated = dict(Recipe.objects.filter(
+            updated_at__gte=snapshot.last_updated - RECIPE_INDEX_OVERLAP
+        ).values_list('id', 'updated_at'))
+        changed = set(updated) | (recipe_ids - snapshot.recipe_ids)
+        removed = snapshot.recipe_ids - recipe_ids
+        changed_compositions = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+            recipe_id__in=list(changed)
+        ).values_list('recipe_id', 'ingredient_id'):
+            changed_compositions[recipe_id].append(ingredient_id)
+        compositions = dict(snapshot.compositions)
+        postings = dict(snapshot.postings)
+        touched = defaultdict(set)
+        stale = changed | removed
+        count = snapshot.rows
+        for recipe_id in stale:
+            ingredients = compositions.pop(recipe_id, ())
+            count -= len(ingredients)
+            for ingredient_id in ingredients:
+                touched[ingredient_id]
+        for recipe_id, ingredients in changed_compositions.items():
+            compositions[recipe_id] = tuple(ingredients)
+            count += len(ingredients)
+            for ingredient_id in ingredients:
+                touched[ingredient_id].add(recipe_id)
+        for ingredient_id, holders in touched.items():
+            holders.update(
+                pk for pk in postings.get(ingredient_id, ())
+                if pk not in stale
+            )
+            if holders:
+                postings[ingredient_id] = array('q', sorted(holders))
+            else:
+                postings.pop(ingredient_id, None)
+        if count != IngredientInRecipe.objects.count():
+            return self._build(version)
+        return RecipeIngredientSnapshot(
+            version, time.monotonic(),
+            max((snapshot.last_updated, *updated.values())), recipe_ids,
+            compositions, postings, count,
+        )
+
+    def _is_actual(self, snapshot, version):
+        return (
+            snapshot is not None
+            and snapshot.version == version
+            and time.monotonic() - snapshot.checked_at
+            < settings.REFERENCE_DATA_CACHE_TIMEOUT
+        )
+
+    def get(self):
+        """Актуальный снимок индекса."""
+        version = get_version(RECIPE_INGREDIENTS_VERSION)
+        snapshot = self._snapshot
+        if not self._is_actual(snapshot, version):
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._build(version)
+                elif not self._is_actual(snapshot, version):
+                    snapshot = self._refresh(snapshot, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def search(self, ingredient_ids):
+        """
+        Рецепты хотя бы с одним из ингредиентов ingredient_ids в виде
+        (рецепт, имеющихся ингредиентов, недостающих ингредиентов),
+        отсортированные по убыванию имеющихся и возрастанию недостающих.
+        """
+        snapshot = self.get()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(snapshot.postings.get(ingredient_id, ()))
+        return sorted(
+            (
+                (recipe_id, count,
+                 len(snapshot.compositions[recipe_id]) - count)
+                for recipe_id, count in matched.items()
+            ),
+            key=lambda item: (-item[1], item[2], -item[0])
+        )
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
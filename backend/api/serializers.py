@@ -1,12 +1,15 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.fields.files import ImageFieldFile
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
-from users.models import Subscribe
+from api.cache import invalidate_recipe_shopping_lists
+from api.fields import StreamingBase64ImageField
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag, recipe_related_lookups)
 from users.serializers import UserSerializer
 
 User = get_user_model()
@@ -41,11 +44,34 @@ class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор получения рецептов."""
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
+    image_thumbnail = serializers.SerializerMethodField()
+    image_card = serializers.SerializerMethodField()
+    image_full = serializers.SerializerMethodField()
     author = UserSerializer(default=serializers.CurrentUserDefault())
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
+    def get_image_variant(self, obj, variant):
+        """
+        Ссылка на уменьшенный вариант изображения, пока варианты
+        не созданы - на исходное изображение.
+        """
+        name = obj.image_variants.get(variant)
+        image = obj.image if name is None else ImageFieldFile(
+            obj, obj.image.field, name
+        )
+        return self.fields['image'].to_representation(image)
+
+    def get_image_thumbnail(self, obj):
+        return self.get_image_variant(obj, 'thumbnail')
+
+    def get_image_card(self, obj):
+        return self.get_image_variant(obj, 'card')
+
+    def get_image_full(self, obj):
+        return self.get_image_variant(obj, 'full')
+
     def get_ingredients(self, obj):
         """Метод получения ингредиентов в рецепте и их количество."""
         return IngredientsInRecipeSerializer(
@@ -55,6 +81,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         """Метод определения избранных рецептов текущего пользователя."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         current_user = self.context['request'].user
         return (
             not current_user.is_anonymous
@@ -66,6 +94,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         Метод определения рецептов добавленных в корзину текущего
         пользователя.
         """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         current_user = self.context['request'].user
         return (
             not current_user.is_anonymous
@@ -75,8 +105,9 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'image', 'author', 'text', 'cooking_time',
-            'ingredients', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'id', 'name', 'image', 'image_thumbnail', 'image_card',
+            'image_full', 'author', 'text', 'cooking_time', 'ingredients',
+            'tags', 'is_favorited', 'is_in_shopping_cart',
         )
         read_only_fields = (
             'id', 'author', 'tags', 'is_favorited', 'is_in_shopping_cart'
@@ -94,32 +125,90 @@ class RecipeShortSerializer(RecipeSerializer):
     """Укороченный сериализатор получения рецептов."""
 
     class Meta(RecipeSerializer.Meta):
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'image_card',
+                  'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeByIngredientsSerializer(RecipeSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам, с
+    количеством имеющихся и недостающих ингредиентов рецепта.
+    """
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_ingredients', 'missing_ingredients',
+        )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для массовых операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+
+def get_recipes_limit(request):
+    """
+    Количество рецептов автора в выдаче подписок из параметра
+    recipes_limit, ограниченное сверху настройкой RECIPES_LIMIT_MAX.
+    """
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return settings.RECIPES_LIMIT
+    return min(max(limit, 0), settings.RECIPES_LIMIT_MAX)
+
+
+def get_ingredient_ids(request):
+    """
+    Идентификаторы ингредиентов из параметра have (через запятую),
+    не больше настройки HAVE_INGREDIENTS_MAX.
+    """
+    try:
+        ingredient_ids = {
+            int(pk) for pk in request.query_params.get('have', '').split(',')
+            if pk.strip()
+        }
+    except ValueError:
+        raise serializers.ValidationError(
+            {'have': 'Укажите идентификаторы ингредиентов через запятую.'}
+        )
+    if not ingredient_ids:
+        raise serializers.ValidationError(
+            {'have': 'Укажите имеющиеся ингредиенты.'}
+        )
+    if len(ingredient_ids) > settings.HAVE_INGREDIENTS_MAX:
+        raise serializers.ValidationError({'have': (
+            'Можно указать не больше '
+            f'{settings.HAVE_INGREDIENTS_MAX} ингредиентов.'
+        )})
+    return ingredient_ids
+
+
 class UserSubscribeSerializer(UserSerializer):
     """Сериализатор подписок пользователя."""
-    recipes = RecipeShortSerializer(many=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
 
-    def get_queryset(self, obj):
+    def get_recipes(self, obj):
         """
         Получение выборки рецептов авторов на которых подписан текущий
-        пользователь.
-        При наличии параметра recipes_limit, возвращается срезанный queryset.
-        """
-        limit = self.context['request'].query_params.get('recipes_limit')
-        if limit:
-            return obj.recipes.all()[:int(limit)]
-        return obj.recipes.all()[:settings.RECIPES_LIMIT]
-
-    def get_recipes_count(self, obj):
+        пользователь, срезанной по параметру recipes_limit.
+        Используются рецепты, заранее подгруженные для всей страницы.
         """
-        Получение общего количества рецептов авторов на которых подписан
-        текущий пользователь.
-        """
-        return obj.recipes.all().count()
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            limit = get_recipes_limit(self.context['request'])
+            recipes = obj.recipes.all()[:limit]
+        return RecipeShortSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
     class Meta(UserSerializer.Meta):
         fields = ('email', 'id', 'username', 'first_name',
@@ -154,29 +243,86 @@ class RecipeSerializerCreate(RecipeSerializer):
         )
 
     def create(self, validated_data):
-        """Метод создания рецепта."""
+        """Метод создания рецепта с ингредиентами и тэгами в транзакции."""
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        self.ingredient_in_recipe_create(recipe, ingredients)
-        recipe.tags.set(tags)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self.ingredient_in_recipe_create(recipe, ingredients)
+            recipe.tags.set(tags)
         return recipe
 
+    def ingredient_in_recipe_update(self, recipe, ingredients):
+        """
+        Метод изменения ингредиентов рецепта по разнице с текущими:
+        изменившиеся количества обновляются, новые ингредиенты
+        добавляются, отсутствующие в запросе удаляются. Повторяющиеся
+        ингредиенты отклоняются при валидации, как и при создании.
+        """
+        ingredients = {
+            ingredient['ingredient'].id: ingredient
+            for ingredient in ingredients
+        }
+        existing = {
+            row.ingredient_id: row
+            for row in recipe.ingredient_in_recipe.all()
+        }
+        changed = []
+        for ingredient_id, row in existing.items():
+            ingredient = ingredients.get(ingredient_id)
+            if ingredient is not None and row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                changed.append(row)
+        removed = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in ingredients
+        ]
+        added = [
+            ingredient for ingredient_id, ingredient in ingredients.items()
+            if ingredient_id not in existing
+        ]
+        if removed:
+            IngredientInRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.ingredient_in_recipe_create(recipe, added)
+        if changed or added:
+            invalidate_recipe_shopping_lists(recipe.id)
+
+    def tags_update(self, recipe, tags):
+        """Метод изменения тэгов рецепта по разнице с текущими."""
+        existing = set(recipe.tags.values_list('id', flat=True))
+        tags = {tag.id for tag in tags}
+        if existing - tags:
+            recipe.tags.remove(*(existing - tags))
+        if tags - existing:
+            recipe.tags.add(*(tags - existing))
+
     def update(self, instance, validated_data):
-        """Метод обновления рецепта."""
+        """
+        Метод обновления рецепта. Ингредиенты и тэги изменяются по
+        разнице с текущими в одной транзакции.
+        """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         for key, value in validated_data.items():
             if hasattr(instance, key):
                 setattr(instance, key, value)
-        instance.ingredient_in_recipe.all().delete()
-        self.ingredient_in_recipe_create(instance, ingredients)
-        instance.tags.set(tags)
-        instance.save()
+        with transaction.atomic():
+            self.ingredient_in_recipe_update(instance, ingredients)
+            self.tags_update(instance, tags)
+            instance.save()
         return instance
 
     def to_representation(self, instance):
-        """Метод замены сериализатора выходных данных."""
+        """
+        Метод замены сериализатора выходных данных. Тэги и ингредиенты
+        подгружаются двумя запросами.
+        """
+        prefetch_related_objects(
+            [instance], *recipe_related_lookups(self.context['request'].user)
+        )
         self.fields.pop('ingredients')
         self.fields.pop('tags')
         representation = super().to_representation(instance)
@@ -190,13 +336,24 @@ class RecipeSerializerCreate(RecipeSerializer):
         return representation
 
     def validate(self, data):
-        """Валидация входных данных ингредиентов и тэгов."""
+        """
+        Валидация входных данных ингредиентов и тэгов: повторяющийся
+        ингредиент нарушил бы уникальность ингредиента в рецепте.
+        """
         ingredients = self.initial_data.get('ingredients')
         tags = self.initial_data.get('tags')
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredients': 'обязательное поле'}
             )
+        ingredient_ids = [
+            ingredient['ingredient'].id
+            for ingredient in data.get('ingredients', ())
+        ]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                {'ingredients': 'ингредиенты не должны повторяться'}
+            )
         if not tags:
             raise serializers.ValidationError(
                 {'tags': 'обязательное поле'}
@@ -205,8 +362,9 @@ class RecipeSerializerCreate(RecipeSerializer):
 
     class Meta(RecipeSerializer.Meta):
         fields = (
-            'id', 'name', 'image', 'author', 'text', 'cooking_time',
-            'ingredients', 'tags', 'is_favorited', 'is_in_shopping_cart'
+            'id', 'name', 'image', 'image_thumbnail', 'image_card',
+            'image_full', 'author', 'text', 'cooking_time', 'ingredients',
+            'tags', 'is_favorited', 'is_in_shopping_cart'
         )
         read_only_fields = (
             'id', 'author', 'is_favorited', 'is_in_shopping_cart'
@@ -220,29 +378,6 @@ class RecipeSerializerCreate(RecipeSerializer):
         ]
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Favorite
-        fields = ('recipe', 'user')
-
-    def validate(self, attrs):
-        recipe = attrs.get('recipe')
-        method = self.context.get('method')
-        current_user = attrs.get('user')
-        if method == 'POST':
-            if recipe.favorite.filter(user=current_user).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Рецепт уже в избранном!'}
-                )
-        elif method == 'DELETE':
-            if not recipe.favorite.filter(user=current_user).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Рецепта нет в избранном!'}
-                )
-        return attrs
-
-
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -250,52 +385,11 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('recipe', 'user')
 
     def validate(self, attrs):
-        recipe = attrs.get('recipe')
         method = self.context.get('method')
         current_user = attrs.get('user')
-        if method == 'POST':
-            if recipe.shopping_cart.filter(user=current_user).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Рецепт уже в корзине!'}
-                )
-        elif method == 'DELETE':
-            if not recipe.shopping_cart.filter(user=current_user).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Рецепта нет в корзине!'}
-                )
-        elif method == 'GET':
+        if method == 'GET':
             if not current_user.shopping_cart.exists():
                 raise serializers.ValidationError(
                     {'errors': 'Корзина пуста!'}
                 )
         return attrs
-
-
-class SubscribeSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Subscribe
-        fields = ('author', 'user')
-
-    def validate(self, attrs):
-        author = attrs.get('author')
-        method = self.context.get('method')
-        current_user = attrs.get('user')
-        if method == 'POST':
-            if author == current_user:
-                raise serializers.ValidationError(
-                    {'errors': 'Подписка на самого себя не возможна!'}
-                )
-            if current_user.subscriber.filter(author=author).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Повторная подписка!'}
-                )
-        elif method == 'DELETE':
-            if author == current_user:
-                raise serializers.ValidationError(
-                    {'errors': 'Отписаться от самого себя невозможно!'}
-                )
-            if not current_user.subscriber.filter(author=author).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Подписка на автора отсутствует!'}
-                )
-        return attrs
@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (INGREDIENTS_VERSION, RECIPE_INGREDIENTS_VERSION,
+                       RECIPES_VERSION, TAGS_VERSION, USER_VERSION,
+                       bump_version, bump_version_on_commit,
+                       invalidate_recipe_shopping_lists,
+                       invalidate_shopping_lists)
+from api.counters import change_counters
+from recipes.images import schedule_image_variants
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    """Сброс кэша списка покупок при изменении корзины."""
+    invalidate_shopping_lists((instance.user_id,))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscribe)
+def user_state_changed(sender, instance, **kwargs):
+    """
+    Смена версии избранного, корзины и подписок пользователя, от которых
+    зависит выдача рецептов.
+    """
+    bump_version_on_commit(USER_VERSION.format(user_id=instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def ingredient_in_recipe_changed(sender, instance, **kwargs):
+    """Сброс кэша списков покупок при изменении ингредиентов рецепта."""
+    invalidate_recipe_shopping_lists(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_ingredients_changed(sender, **kwargs):
+    """
+    Смена версии состава рецептов для индекса поиска по ингредиентам.
+    Версия меняется после фиксации транзакции, чтобы индекс не обновился
+    до записи всех ингредиентов рецепта.
+    """
+    transaction.on_commit(
+        lambda: bump_version(RECIPE_INGREDIENTS_VERSION)
+    )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """
+    Смена версии справочника ингредиентов, от которой зависят и хэши
+    списков покупок.
+    """
+    bump_version_on_commit(INGREDIENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    """
+    Смена версии справочника тэгов, от которой зависит и соответствие
+    слагов идентификаторам в фильтре рецептов по тэгам.
+    """
+    bump_version_on_commit(TAGS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Subscribe)
+def counted_object_changed(sender, instance, signal, created=False,
+                           **kwargs):
+    """Изменение счетчиков при создании и удалении объектов."""
+    if signal is post_delete:
+        change_counters(sender, (instance,), -1)
+    elif created:
+        change_counters(sender, (instance,), 1)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_published(sender, signal, created=False, **kwargs):
+    """
+    Смена версии рецептов при публикации и удалении рецепта, в том числе
+    после фиксации транзакции: лента, собранная до фиксации, устаревает.
+    """
+    if signal is post_delete or created:
+        bump_version_on_commit(RECIPES_VERSION)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, raw=False, **kwargs):
+    """Фоновая обработка нового изображения рецепта."""
+    if raw or not instance.image:
+        return
+    if instance.image_variants.get('source') != instance.image.name:
+        schedule_image_variants(instance.pk)
+
+
+def relations_bulk_changed(sender, objs, delta):
+    """
+    Обновление счетчиков, версий и кэша списков покупок после массового
+    добавления (delta=1) или удаления (delta=-1) связей objs в обход
+    сигналов: один запрос на счетчики вместо запроса на каждую связь.
+    """
+    if not objs:
+        return
+    change_counters(sender, objs, delta)
+    user_ids = {obj.user_id for obj in objs}
+    for user_id in user_ids:
+        bump_version_on_commit(USER_VERSION.format(user_id=user_id))
+    if sender is ShoppingCart:
+        invalidate_shopping_lists(user_ids)
@@ -1,9 +1,15 @@
+import csv
+import json
 import os
+from collections import namedtuple
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfbase.ttfonts import TTFont
@@ -15,39 +21,56 @@ FONT_NAME = 'DejaVuSans'
 LOGO_FILENAME = 'logo.png'
 LOGO_HEIGHT = 50
 LOGO_WIDTH = 50
+PDF_SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+SHOPPING_LIST_FILENAME = 'file'
+DEFAULT_SHOPPING_LIST_FORMAT = 'pdf'
 
 
-def add_logo(pdf, y_cord_start):
-    """Функция добавления logo в заголовок PDF-файла."""
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрация шрифта PDF-файла, выполняется один раз на процесс."""
+    font_path = os.path.join(
+        settings.STATIC_ROOT, 'font', f'{FONT_NAME}.ttf'
+    )
+    pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    return FONT_NAME
+
+
+@lru_cache(maxsize=None)
+def get_logo():
+    """Загрузка logo PDF-файла, выполняется один раз на процесс."""
     logo_path = os.path.join(
         settings.STATIC_ROOT, 'logo', LOGO_FILENAME
     )
+    return ImageReader(logo_path)
+
+
+def add_logo(pdf, y_cord_start):
+    """Функция добавления logo в заголовок PDF-файла."""
     x_cord_center = (A4[0] - LOGO_WIDTH) / 2.0
     y_cord_start = y_cord_start - LOGO_HEIGHT
     pdf.drawImage(
-        logo_path, x_cord_center, y_cord_start, width=LOGO_WIDTH,
+        get_logo(), x_cord_center, y_cord_start, width=LOGO_WIDTH,
         height=LOGO_HEIGHT, preserveAspectRatio=True, mask='auto')
     return y_cord_start - 10
 
 
 def download_pdf_file(annotated_results):
     """
-    Запись результатов аннотирования в PDF с последующим скачиванием
-    файла.
+    Запись результатов аннотирования в PDF-файл.
+    PDF-файл записывается во временный буфер, который при превышении
+    PDF_SPOOL_MAX_SIZE сбрасывается на диск, и отдается частями.
     """
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="file.pdf"'
-    pdf = canvas.Canvas(response)
+    buffer = SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(buffer)
     x_cord = 1 * inch
     y_cord_start = A4[1] * 0.95
     y_cord_start = add_logo(pdf, y_cord_start)
-    font_path = os.path.join(
-        settings.STATIC_ROOT, 'font', f'{FONT_NAME}.ttf'
-    )
-    pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    register_font()
 
     pdf.setFont(FONT_NAME, SIZE_FONT)
-    header_width = stringWidth(HEADER_TEXT, 'DejaVuSans', SIZE_FONT)
+    header_width = stringWidth(HEADER_TEXT, FONT_NAME, SIZE_FONT)
     x_cord_center = (A4[0] - header_width) / 2.0
     pdf.drawString(
         x_cord_center, y_cord_start,
@@ -67,4 +90,77 @@ def download_pdf_file(annotated_results):
             y_cord = y_cord_start
             pdf.setFont(FONT_NAME, SIZE_FONT)
     pdf.save()
+    buffer.seek(0)
+    with buffer:
+        yield from iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+def download_txt_file(annotated_results):
+    """Построчная запись результатов аннотирования в текстовый файл."""
+    yield f'{HEADER_TEXT}\n\n'.encode()
+    for num, item in enumerate(annotated_results, start=1):
+        yield (
+            f'{num}. {item}: {item.sum_ingredients}'
+            f' {item.measurement_unit}\n'
+        ).encode()
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def download_csv_file(annotated_results):
+    """Построчная запись результатов аннотирования в CSV-файл."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(
+        ('name', 'measurement_unit', 'amount')
+    ).encode('utf-8-sig')
+    for item in annotated_results:
+        yield writer.writerow(
+            (item.name, item.measurement_unit, item.sum_ingredients)
+        ).encode()
+
+
+def download_json_file(annotated_results):
+    """Запись результатов аннотирования в JSON-файл по одному объекту."""
+    separator = '['
+    for item in annotated_results:
+        yield (separator + json.dumps({
+            'name': item.name,
+            'measurement_unit': item.measurement_unit,
+            'amount': item.sum_ingredients,
+        }, ensure_ascii=False)).encode()
+        separator = ','
+    yield b'[]' if separator == '[' else b']'
+
+
+ShoppingListRenderer = namedtuple(
+    'ShoppingListRenderer', ('content_type', 'render')
+)
+
+SHOPPING_LIST_RENDERERS = {
+    'pdf': ShoppingListRenderer('application/pdf', download_pdf_file),
+    'txt': ShoppingListRenderer(
+        'text/plain; charset=utf-8', download_txt_file
+    ),
+    'csv': ShoppingListRenderer('text/csv; charset=utf-8', download_csv_file),
+    'json': ShoppingListRenderer('application/json', download_json_file),
+}
+
+
+def shopping_list_response(content, file_format):
+    """
+    Потоковый ответ со списком покупок в формате file_format.
+    content - итератор частей файла.
+    """
+    response = StreamingHttpResponse(
+        content,
+        content_type=SHOPPING_LIST_RENDERERS[file_format].content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{SHOPPING_LIST_FILENAME}.{file_format}"'
+    )
     return response
@@ -1,51 +1,213 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db.models import Count, Max, Sum, prefetch_related_objects
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import filters, status, viewsets
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from api.cache import (cache_shopping_list_file, get_shopping_list_digest,
+                       get_shopping_list_file, ingredients_cache, recipes_etag,
+                       serialized_data, tags_cache)
+from api.feed import get_feed_timeline_ids, subscribed_recipes
 from api.filters import RecipeFilter
-from api.pagination import LimitPageNumberPagination
+from api.negotiation import IgnoreFormatContentNegotiation
+from api.pagination import (LimitCursorPagination,
+                            LimitPageNumberOrCursorPagination,
+                            LimitPageNumberPagination)
 from api.permissions import IsOwnerOrReadOnly
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             RecipeSerializer, RecipeSerializerCreate,
-                             RecipeShortSerializer, ShoppingCartSerializer,
-                             TagSerializer, UserSubscribeSerializer)
-from api.utils import download_pdf_file
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from api.search import recipe_ingredient_index, search_ingredients
+from api.serializers import (IngredientSerializer,
+                             RecipeByIngredientsSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
+                             RecipeSerializerCreate, RecipeShortSerializer,
+                             ShoppingCartSerializer, TagSerializer,
+                             UserSubscribeSerializer, get_ingredient_ids,
+                             get_recipes_limit)
+from api.signals import relations_bulk_changed
+from api.utils import (DEFAULT_SHOPPING_LIST_FORMAT, SHOPPING_LIST_RENDERERS,
+                       shopping_list_response)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            recipe_related_lookups)
 from users.models import Subscribe
 
 User = get_user_model()
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class CachedListMixin:
+    """
+    Отдача списка справочника из кэша сериализованных данных
+    с поддержкой условных запросов по ETag и Last-Modified.
+    """
+    list_cache = None
+
+    def render_list(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return serialized_data(JSONRenderer().render(serializer.data))
+
+    def list(self, request, *args, **kwargs):
+        data = self.list_cache.get(self.render_list)
+        response = get_conditional_response(
+            request, etag=data.etag, last_modified=data.last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                data.content, content_type='application/json'
+            )
+        response['ETag'] = data.etag
+        response['Last-Modified'] = http_date(data.last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class TagsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет тэгов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    list_cache = tags_cache
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+    list_cache = ingredients_cache
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов. При наличии параметра name возвращаются
+        найденные для автодополнения ингредиенты.
+        """
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if name:
+            return Response(search_ingredients(name))
+        return super().list(request, *args, **kwargs)
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
     """Вьюсет рецептов."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitPageNumberOrCursorPagination
+    cursor_ordering = ('-pub_date', '-id')
     permission_classes = (IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Для чтения рецептов связанные объекты и признаки избранного,
+        корзины и подписки подгружаются фиксированным числом запросов.
+        В списке они добавляются после фильтрации, чтобы валидаторы
+        условного запроса считались по индексам без подзапросов.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset
+        queryset = queryset.with_user_flags(self.request.user)
+        if self.action == 'retrieve':
+            return queryset.with_related(self.request.user)
+        return queryset
+
+    def conditional_response(self, request, last_modified, count, view):
+        """
+        Ответ на условный запрос по ETag и Last-Modified. Если выборка
+        не изменилась, возвращается 304 без сериализации рецептов.
+        Last-Modified отдается только анонимным пользователям: выдача
+        авторизованных зависит еще и от их избранного, корзины и подписок.
+        """
+        etag = recipes_etag(request, last_modified, count)
+        if request.user.is_anonymous and last_modified:
+            last_modified = int(last_modified.timestamp())
+        else:
+            last_modified = None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view()
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов с поддержкой условных запросов.
+        Валидаторы вычисляются по данным рецептов, включая счетчики
+        избранного и рейтинг популярности, которые меняются без смены
+        даты изменения рецепта. При курсорной пагинации валидаторы
+        вычисляются по рецептам страницы, без агрегации по всей выборке.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        recipes = queryset.with_user_flags(request.user).with_related(
+            request.user
+        )
+        if self.paginator.is_cursor_request(request):
+            page = self.paginate_queryset(recipes)
+            return self.conditional_response(
+                request,
+                max((recipe.updated_at for recipe in page), default=None),
+                tuple(
+                    (recipe.id, recipe.favorites_count, recipe.trending_score)
+                    for recipe in page
+                ),
+                lambda: self.get_paginated_response(
+                    self.get_serializer(page, many=True).data
+                )
+            )
+        validators = queryset.aggregate(
+            last_modified=Max('updated_at'), count=Count('id'),
+            favorites=Sum('favorites_count'), trending=Sum('trending_score'),
+        )
+
+        def view():
+            page = self.paginate_queryset(recipes)
+            if page is None:
+                return Response(
+                    self.get_serializer(recipes, many=True).data
+                )
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return self.conditional_response(
+            request, validators['last_modified'],
+            (validators['count'], validators['favorites'],
+             validators['trending']),
+            view
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт с поддержкой условных запросов."""
+        try:
+            last_modified = Recipe.objects.filter(
+                pk=kwargs[self.lookup_field]
+            ).values_list('updated_at', flat=True).first()
+        except ValueError:
+            last_modified = None
+        return self.conditional_response(
+            request, last_modified, 1,
+            lambda: super(RecipesViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -55,54 +217,206 @@ class RecipesViewSet(viewsets.ModelViewSet):
             return RecipeSerializerCreate
         return RecipeSerializer
 
+    def relation_response(self, request, pk, model, errors):
+        """
+        Добавление рецепта в избранное или корзину и удаление из них.
+        Связь создается и удаляется одним запросом, рецепт запрашивается
+        для ответа на добавление и для выбора ошибки при удалении.
+        """
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, pk=pk)
+            if model.objects.add(user=request.user, recipe=recipe) is None:
+                raise serializers.ValidationError({'errors': errors['POST']})
+            serializer = RecipeShortSerializer(recipe)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if model.objects.remove(user=request.user, recipe=pk) is None:
+            get_object_or_404(Recipe, pk=pk)
+            raise serializers.ValidationError({'errors': errors['DELETE']})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True,
             permission_classes=(IsAuthenticated,),
             methods=('POST', 'DELETE',))
     def favorite(self, request, pk=None):
         """Добавление/удаление рецептов в избранное."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        current_user = self.request.user
-        serializer = FavoriteSerializer(
-            data={'recipe': pk, 'user': current_user.id},
-            context={'method': self.request.method}
-        )
-        serializer.is_valid(raise_exception=True)
-        if self.request.method == 'POST':
-            Favorite.objects.create(recipe=recipe, user=self.request.user)
-            serializer = RecipeShortSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        elif self.request.method == 'DELETE':
-            favorite = recipe.favorite.filter(user=self.request.user)
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.relation_response(request, pk, Favorite, {
+            'POST': 'Рецепт уже в избранном!',
+            'DELETE': 'Рецепта нет в избранном!',
+        })
 
     @action(detail=True,
             permission_classes=(IsAuthenticated,),
             methods=('POST', 'DELETE',))
     def shopping_cart(self, request, pk=None):
         """Добавление/удаление рецептов в корзину покупок."""
-        recipe = get_object_or_404(Recipe, pk=pk)
-        current_user = self.request.user
-        serializer = ShoppingCartSerializer(
-            data={'recipe': pk, 'user': current_user.id},
-            context={'method': self.request.method}
+        return self.relation_response(request, pk, ShoppingCart, {
+            'POST': 'Рецепт уже в корзине!',
+            'DELETE': 'Рецепта нет в корзине!',
+        })
+
+    @action(detail=True,
+            methods=('GET',))
+    def similar(self, request, pk=None):
+        """
+        Похожие рецепты из таблицы, рассчитанной командой
+        update_similar_recipes, выбираются одним запросом по индексу
+        сходства. Рецепт запрашивается, только если похожих нет.
+        """
+        recipes = Recipe.objects.filter(similar_to__recipe_id=pk).order_by(
+            '-similar_to__score', '-similar_to__similar_id'
+        )[:settings.SIMILAR_RECIPES_LIMIT]
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = RecipeShortSerializer(
+            recipes, many=True, context=self.get_serializer_context()
         )
+        return Response(serializer.data)
+
+    def relations_batch_response(self, request, model):
+        """
+        Массовое добавление рецептов в избранное или корзину и удаление
+        из них: один запрос INSERT ... ON CONFLICT DO NOTHING RETURNING
+        или DELETE ... RETURNING на весь список и результат по каждому
+        рецепту.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        if self.request.method == 'POST':
-            ShoppingCart.objects.create(recipe=recipe, user=self.request.user)
-            serializer = RecipeShortSerializer(recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        elif self.request.method == 'DELETE':
-            shopping_cart = recipe.shopping_cart.filter(user=self.request.user)
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        if request.method == 'POST':
+            found = set(Recipe.objects.filter(
+                pk__in=recipe_ids
+            ).values_list('pk', flat=True))
+            changed = model.objects.add_many([
+                model(user=request.user, recipe_id=pk)
+                for pk in recipe_ids if pk in found
+            ])
+            statuses = ('added', 'exists')
+        else:
+            found = None
+            changed = model.objects.remove_many(
+                user=request.user, recipe=recipe_ids
+            )
+            statuses = ('removed', 'absent')
+        relations_bulk_changed(
+            model, changed, 1 if request.method == 'POST' else -1
+        )
+        changed_ids = {obj.recipe_id for obj in changed}
+        return Response([
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if found is not None and pk not in found
+                    else statuses[pk not in changed_ids]
+                ),
+            }
+            for pk in recipe_ids
+        ])
+
+    @action(detail=False,
+            url_path='favorite',
+            url_name='favorite-batch',
+            permission_classes=(IsAuthenticated,),
+            methods=('POST', 'DELETE',))
+    def favorite_batch(self, request):
+        """Добавление/удаление списка рецептов в избранное."""
+        return self.relations_batch_response(request, Favorite)
+
+    @action(detail=False,
+            url_path='shopping_cart',
+            url_name='shopping-cart-batch',
+            permission_classes=(IsAuthenticated,),
+            methods=('POST', 'DELETE',))
+    def shopping_cart_batch(self, request):
+        """Добавление/удаление списка рецептов в корзину покупок."""
+        return self.relations_batch_response(request, ShoppingCart)
 
     @action(detail=False,
             permission_classes=(IsAuthenticated,),
             methods=('GET',))
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь,
+        с курсорной пагинацией. Для подписанных на множество авторов
+        начало ленты берется из кэша, страницы дальше кэшированной ленты
+        запрашиваются из рецептов. Связанные объекты подгружаются после
+        выбора страницы.
+        """
+        paginator = LimitCursorPagination()
+        timeline = get_feed_timeline_ids(
+            request.user, paginator.decode_cursor(request)
+        )
+        page = None
+        if timeline is not None:
+            recipe_ids, truncated = timeline
+            page = paginator.paginate_queryset(
+                self.get_queryset().filter(pk__in=recipe_ids), request,
+                view=self
+            )
+            if truncated and not paginator.has_next:
+                page = None
+        if page is None:
+            page = paginator.paginate_queryset(
+                subscribed_recipes(self.get_queryset(), request.user),
+                request, view=self
+            )
+        prefetch_related_objects(page, *recipe_related_lookups(request.user))
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            url_path='by_ingredients',
+            methods=('GET',))
+    def by_ingredients(self, request):
+        """
+        Рецепты, которые можно приготовить из имеющихся ингредиентов
+        (параметр have): сначала с большим числом имеющихся, затем
+        с меньшим числом недостающих ингредиентов. Подбор и сортировка
+        выполняются по индексу в памяти, из базы данных запрашивается
+        только страница рецептов.
+        """
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(
+            recipe_ingredient_index.search(get_ingredient_ids(request)),
+            request, view=self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        result = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_ingredients = matched
+                recipe.missing_ingredients = missing
+                result.append(recipe)
+        prefetch_related_objects(
+            result, *recipe_related_lookups(request.user)
+        )
+        serializer = RecipeByIngredientsSerializer(
+            result, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            permission_classes=(IsAuthenticated,),
+            methods=('GET',),
+            content_negotiation_class=IgnoreFormatContentNegotiation)
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок для рецептов добавленных в корзину."""
+        """
+        Скачивание списка покупок для рецептов добавленных в корзину.
+        Формат файла задается параметром format: pdf, txt, csv или json.
+        Готовый файл кэшируется по хэшу содержимого списка, ETag
+        позволяет клиенту не скачивать неизменившийся список повторно.
+        """
+        file_format = request.query_params.get(
+            'format', DEFAULT_SHOPPING_LIST_FORMAT
+        )
+        if file_format not in SHOPPING_LIST_RENDERERS:
+            return Response(
+                {'format': 'Допустимые форматы: '
+                           f'{", ".join(SHOPPING_LIST_RENDERERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer = ShoppingCartSerializer(
             data={'user': self.request.user.id},
             context={'method': self.request.method}
@@ -113,37 +427,72 @@ class RecipesViewSet(viewsets.ModelViewSet):
         )
         annotated_results = ingredients.annotate(
             sum_ingredients=Sum('ingredient_in_recipe__amount')
-        )
-        return download_pdf_file(annotated_results)
+        ).order_by('name', 'id')
+        digest = get_shopping_list_digest(request.user, annotated_results)
+        etag = quote_etag(f'{digest}-{file_format}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = get_shopping_list_file(digest, file_format)
+            if content is None:
+                content = cache_shopping_list_file(
+                    SHOPPING_LIST_RENDERERS[file_format].render(
+                        annotated_results
+                    ),
+                    digest, file_format
+                )
+            else:
+                content = (content,)
+            response = shopping_list_response(content, file_format)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class MyUsersViewSet(UserViewSet):
     """Вьюсет подписок пользователей."""
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitPageNumberOrCursorPagination
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        """Пользователи аннотируются признаком подписки текущего."""
+        return super().get_queryset().with_subscription(self.request.user)
 
     @action(detail=True,
             permission_classes=(IsAuthenticated,),
             methods=('POST', 'DELETE',))
     def subscribe(self, request, id=None):
-        """Добавление/удаление авторов в подписки."""
-        author = get_object_or_404(User, pk=id)
+        """
+        Добавление/удаление авторов в подписки. Подписка создается
+        и удаляется одним запросом.
+        """
         current_user = request.user
-        serializer = FavoriteSerializer(
-            data={'author': author.pk, 'user': current_user.id},
-            context={'method': self.request.method}
-        )
-        serializer.is_valid()
         if request.method == 'POST':
-            Subscribe.objects.create(user=current_user,
-                                     author=author)
+            author = get_object_or_404(User, pk=id)
+            if author == current_user:
+                raise serializers.ValidationError(
+                    {'errors': 'Подписка на самого себя не возможна!'}
+                )
+            if Subscribe.objects.add(
+                    user=current_user, author=author) is None:
+                raise serializers.ValidationError(
+                    {'errors': 'Повторная подписка!'}
+                )
+            author.is_subscribed = True
             serializer = UserSubscribeSerializer(
                 author,
                 context={'request': request}
             )
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
-        subscribe = current_user.subscriber.filter(author=author)
-        subscribe.delete()
+        if Subscribe.objects.remove(user=current_user, author=id) is None:
+            author = get_object_or_404(User, pk=id)
+            if author == current_user:
+                raise serializers.ValidationError(
+                    {'errors': 'Отписаться от самого себя невозможно!'}
+                )
+            raise serializers.ValidationError(
+                {'errors': 'Подписка на автора отсутствует!'}
+            )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False,
@@ -152,11 +501,21 @@ class MyUsersViewSet(UserViewSet):
     def subscriptions(self, request):
         """
         Получение списка рецептов авторов на которых подписан
-        пользователь.
+        пользователь. С параметром cursor авторы разбиваются на страницы
+        курсором по id.
         """
-        queryset = User.objects.filter(subscribed__user=request.user)
+        queryset = User.objects.filter(
+            subscribed__user=request.user
+        ).with_subscription(request.user).order_by('id')
+        authors = self.paginate_queryset(queryset)
+        latest_recipes = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_author(
+                authors, get_recipes_limit(request)):
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
         serializer = UserSubscribeSerializer(
-            self.paginate_queryset(queryset),
+            authors,
             context={'request': request},
             many=True
         )
@@ -81,6 +81,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.PyMemcacheCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='memcached:11211'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -154,6 +164,8 @@ MEDIA_URL = '/backend_media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentHashStorage'
+
 EMPTY_VALUE_DISPLAY = '-пусто-'
 
 LIST_PER_PAGE = 20
@@ -161,3 +173,55 @@ LIST_PER_PAGE = 20
 PAGE_SIZE = 6
 
 RECIPES_LIMIT = 6
+
+RECIPES_LIMIT_MAX = 50
+
+BATCH_MAX_SIZE = 100
+
+HAVE_INGREDIENTS_MAX = 100
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+
+SHOPPING_LIST_CACHE_MAX_SIZE = 512 * 1024
+
+INGREDIENT_SEARCH_BACKEND = os.getenv(
+    'INGREDIENT_SEARCH_BACKEND', default='memory'
+)
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+REFERENCE_DATA_CACHE_TIMEOUT = 60 * 5
+
+TRENDING_WINDOW_DAYS = 7
+
+TRENDING_HALF_LIFE_HOURS = 24
+
+TRENDING_WEIGHTS = {'favorite': 1.0, 'shopping_cart': 0.5}
+
+SIMILAR_RECIPES_LIMIT = 10
+
+SIMILAR_RECIPES_TAG_WEIGHT = 0.5
+
+SIMILAR_RECIPES_MAX_CANDIDATES = 1000
+
+FEED_TIMELINE_MIN_SUBSCRIPTIONS = 100
+
+FEED_TIMELINE_SIZE = 500
+
+FEED_TIMELINE_CACHE_TIMEOUT = 60 * 10
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+
+RECIPE_IMAGE_FORMATS = ('jpeg', 'png', 'gif', 'webp')
+
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
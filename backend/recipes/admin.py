@@ -1,6 +1,5 @@
 from django.conf import settings
 from django.contrib import admin
-from django.db.models import Count
 from django.utils.html import format_html
 
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
@@ -25,17 +24,11 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'tags__name', 'tags__slug', 'author__username')
     list_per_page = settings.LIST_PER_PAGE
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(
-            favorite_count=Count('favorite')
-        )
-
     @admin.display(description='Добавлено в избранное')
     def add_to_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
-    add_to_favorite.admin_order_field = 'favorite_count'
+    add_to_favorite.admin_order_field = 'favorites_count'
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,67 @@
+from django.db import connections
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+        'AFTER INSERT ON recipes_recipe BEGIN '
+        'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+    'recipes_recipe_fts_delete': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+        'AFTER DELETE ON recipes_recipe BEGIN '
+        'INSERT INTO recipes_recipe_fts '
+        '(recipes_recipe_fts, rowid, name, text) '
+        "VALUES ('delete', old.id, old.name, old.text); END"
+    ),
+    'recipes_recipe_fts_update': (
+        'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+        'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+        'INSERT INTO recipes_recipe_fts '
+        '(recipes_recipe_fts, rowid, name, text) '
+        "VALUES ('delete', old.id, old.name, old.text); "
+        'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+        'VALUES (new.id, new.name, new.text); END'
+    ),
+}
+
+
+def missing_search_triggers(using='default'):
+    """
+    Триггеры таблицы FTS5 из миграции recipes.0012_recipe_search,
+    отсутствующие в базе данных SQLite. Для других баз данных и до
+    создания таблицы FTS5 возвращается пустой список.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            (f'{FTS_TABLE}%',)
+        )
+        names = {name for _, name in cursor.fetchall()}
+    if FTS_TABLE not in names:
+        return []
+    return [name for name in SQLITE_TRIGGERS if name not in names]
+
+
+def restore_search_triggers(using='default', **kwargs):
+    """
+    Восстановление триггеров полнотекстового индекса рецептов после
+    миграций. Пересоздание таблицы рецептов миграцией на SQLite удаляет
+    триггеры: они создаются заново, а индекс перестраивается, так как
+    записи без триггеров в него не попали.
+    """
+    missing = missing_search_triggers(using)
+    if not missing:
+        return
+    with connections[using].cursor() as cursor:
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+        )
@@ -0,0 +1,100 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """Пул потоков обработки изображений, создается при первой задаче."""
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def variant_format():
+    """WebP, если Pillow собран с его поддержкой, иначе JPEG."""
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def variant_name(source, variant, image_format):
+    """Имя файла варианта рядом с исходным изображением."""
+    return '{}_{}.{}'.format(
+        os.path.splitext(source)[0], variant,
+        'jpg' if image_format == 'JPEG' else image_format.lower(),
+    )
+
+
+def render_variant(image, size, image_format):
+    """Уменьшенная копия изображения, вписанная в размер size."""
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG':
+        variant = variant.convert('RGB')
+    elif variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA')
+    buffer = io.BytesIO()
+    variant.save(
+        buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True,
+    )
+    return buffer.getvalue()
+
+
+def generate_image_variants(recipe_id):
+    """
+    Создание уменьшенных вариантов изображения рецепта по настройке
+    RECIPE_IMAGE_VARIANTS. Варианты сохраняются, только если изображение
+    рецепта не сменилось за время обработки.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return None
+    source = recipe.image.name
+    storage = recipe.image.storage
+    image_format = variant_format()
+    with storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    variants = {'source': source}
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        variants[variant] = storage.save(
+            variant_name(source, variant, image_format),
+            ContentFile(render_variant(image, size, image_format)),
+        )
+    Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    return variants
+
+
+def process_image(recipe_id):
+    """Задача пула: обработка изображения с закрытием соединения с БД."""
+    try:
+        generate_image_variants(recipe_id)
+    except Exception:
+        logger.exception('Image processing failed for recipe %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(recipe_id):
+    """
+    Постановка обработки изображения рецепта в пул после фиксации
+    транзакции, чтобы ответ на запрос не ждал обработки.
+    """
+    transaction.on_commit(
+        lambda: get_executor().submit(process_image, recipe_id)
+    )
@@ -0,0 +1,65 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+def walk(storage, directory):
+    """Имена всех файлов каталога directory хранилища storage."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for file in files:
+        yield posixpath.join(directory, file)
+    for subdirectory in directories:
+        yield from walk(storage, posixpath.join(directory, subdirectory))
+
+
+class Command(BaseCommand):
+    """
+    Команда для удаления файлов изображений, на которые не ссылается ни
+    один рецепт. Ссылки считаются по изображениям рецептов и их
+    уменьшенным вариантам, один файл может использоваться несколькими
+    рецептами. Файлы моложе --min-age часов не удаляются, чтобы не
+    задеть загруженные в еще не зафиксированных транзакциях.
+    Запуск:
+    python manage.py collect_media_garbage
+    python manage.py collect_media_garbage --dry-run
+    """
+    help = 'Удаляет неиспользуемые файлы изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='minimal age of removed files in hours')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only list unused files')
+
+    def handle(self, *args, **kwargs):
+        references = Counter()
+        recipes = Recipe.objects.values_list('image', 'image_variants')
+        for image, variants in recipes.iterator():
+            references[image] += 1
+            references.update(
+                name for variant, name in variants.items()
+                if variant != 'source'
+            )
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        threshold = timezone.now() - timedelta(hours=kwargs['min_age'])
+        removed = 0
+        for name in walk(storage, field.upload_to):
+            if references[name] or storage.get_modified_time(name) > threshold:
+                continue
+            if kwargs['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+            removed += 1
+        self.stdout.write(
+            f'{"Found" if kwargs["dry_run"] else "Removed"} '
+            f'{removed} unused files'
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Команда для создания уменьшенных вариантов изображений рецептов,
+    загруженных до появления фоновой обработки или с ошибкой обработки.
+    Запуск:
+    python manage.py generate_image_variants
+    python manage.py generate_image_variants --all
+    """
+    help = 'Создает уменьшенные варианты изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='regenerate variants of all recipes')
+
+    def handle(self, *args, **kwargs):
+        generated = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'image', 'image_variants'
+        )
+        for recipe in recipes.iterator():
+            if (kwargs['all'] or recipe.image_variants.get('source')
+                    != recipe.image.name):
+                generate_image_variants(recipe.pk)
+                generated += 1
+        self.stdout.write(f'Generated variants for {generated} recipes')
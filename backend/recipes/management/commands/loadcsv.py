@@ -1,43 +1,246 @@
 import csv
+import io
+import json
 import os
 import sys
+import time
+from itertools import islice
 
 from django.apps import apps
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection, models
 from django.db.transaction import atomic
 
+from api.cache import bump_model_version
+
+FORMATS = ('csv', 'json')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file, fieldnames=None):
+    """Построчное чтение csv, fieldnames - поля файла без заголовка."""
+    yield from csv.DictReader(file, fieldnames=fieldnames, delimiter=',')
+
+
+def read_json(file, fieldnames=None):
+    """
+    Потоковое чтение массива объектов json (или объектов, разделенных
+    пробельными символами) без загрузки всего файла в память.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in '[], \t\r\n':
+            position += 1
+        try:
+            row, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        if fieldnames and isinstance(row, list):
+            row = dict(zip(fieldnames, row))
+        yield row
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def get_unique_fields(model):
+    """Естественный ключ модели: первое ограничение уникальности."""
+    for constraint in model._meta.constraints:
+        if (isinstance(constraint, models.UniqueConstraint)
+                and constraint.fields and constraint.condition is None):
+            return list(constraint.fields)
+    for field in model._meta.concrete_fields:
+        if field.unique and not field.primary_key:
+            return [field.name]
+    return None
+
+
+def copy_value(value):
+    """Значение для COPY в формате csv: NULL передается без кавычек."""
+    if value is None:
+        return ''
+    return '"{}"'.format(str(value).replace('"', '""'))
+
 
 class Command(BaseCommand):
     """
-    Команда для извлечения данных из csv.
+    Команда для загрузки данных из csv или json.
+    Данные читаются потоково и загружаются пачками по --batch-size
+    объектов, каждая в своей транзакции. Существующие объекты ищутся по
+    естественному ключу (ограничению уникальности модели либо
+    --unique-fields) и обновляются, новые создаются. На PostgreSQL
+    пачка загружается через COPY во временную таблицу и
+    INSERT ... ON CONFLICT.
     Запуск:
-    python manage.py loadcsv --filename ingredients --app recipe
-     --model ingredient.
+    python manage.py loadcsv --filename ingredients --app recipes
+     --model ingredient
+    python manage.py loadcsv --path ../data/ingredients.json --app recipes
+     --model ingredient
     """
-    help = 'Создает данные из csv'
+    help = 'Создает и обновляет данные из csv или json'
 
     def add_arguments(self, parser):
         parser.add_argument('--filename', type=str, help='filename')
+        parser.add_argument('--path', type=str, help='path to file')
         parser.add_argument('--app', type=str, help='app name')
         parser.add_argument('--model', type=str, help='model name to load')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='file format, by default from extension')
+        parser.add_argument('--fields', nargs='+',
+                            help='field names for files without header')
+        parser.add_argument('--unique-fields', nargs='+',
+                            help='natural key fields')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='objects per batch')
 
-    @atomic
     def handle(self, *args, **kwargs):
-        file_name = kwargs['filename']
-        app_label = kwargs['app']
-        model_name = kwargs['model']
-        file = os.path.join(settings.BASE_DIR, 'static', 'data',
-                            f'{file_name}.csv')
+        path = kwargs['path'] or os.path.join(
+            settings.BASE_DIR, 'static', 'data', f'{kwargs["filename"]}.csv'
+        )
+        file_format = kwargs['format'] or os.path.splitext(path)[1][1:]
+        if file_format not in READERS:
+            sys.exit(f"Unknown format '{file_format}'")
         try:
-            model = apps.get_model(app_label=app_label, model_name=model_name)
-            model.objects.all().delete()
-            with open(file, "r", encoding="utf-8-sig") as csv_file:
-                data = csv.DictReader(csv_file, delimiter=",")
-                model.objects.bulk_create(
-                    model(**row) for row in data
-                )
+            self.model = apps.get_model(
+                app_label=kwargs['app'], model_name=kwargs['model']
+            )
+            self.unique_fields = (
+                kwargs['unique_fields'] or get_unique_fields(self.model)
+            )
+            if not self.unique_fields:
+                sys.exit('Natural key not found, use --unique-fields')
+            self.fields = [
+                field for field in self.model._meta.concrete_fields
+                if not field.primary_key
+            ]
+            self.update_fields = [
+                field.name for field in self.fields
+                if field.name not in self.unique_fields
+            ]
+            with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+                self.load(READERS[file_format](file, kwargs['fields']),
+                          kwargs['batch_size'])
         except IOError:
-            sys.exit(f"File with filename '{file_name}.csv' not found")
+            sys.exit(f"File '{path}' not found")
         except Exception as error:
             sys.exit(error)
+        bump_model_version(self.model)
+
+    def load(self, rows, batch_size):
+        load_batch = (
+            self.copy_batch if connection.vendor == 'postgresql'
+            else self.upsert_batch
+        )
+        rows = iter(rows)
+        total = 0
+        start = time.monotonic()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            objs = {}
+            for row in batch:
+                obj = self.model(**row)
+                objs[self.natural_key(obj)] = obj
+            with atomic():
+                load_batch(list(objs.values()))
+            total += len(batch)
+            rate = total / max(time.monotonic() - start, 1e-6)
+            self.stdout.write(f'{total} rows, {rate:.0f} rows/s')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {total} rows in {time.monotonic() - start:.1f} s'
+        ))
+
+    def natural_key(self, obj):
+        return tuple(getattr(obj, field) for field in self.unique_fields)
+
+    def upsert_batch(self, objs):
+        """Обновление найденных по естественному ключу и создание новых."""
+        first_field = self.unique_fields[0]
+        existing = {
+            self.natural_key(obj): obj
+            for obj in self.model.objects.filter(**{
+                f'{first_field}__in': {
+                    getattr(obj, first_field) for obj in objs
+                }
+            })
+        }
+        to_create = []
+        to_update = []
+        for obj in objs:
+            current = existing.get(self.natural_key(obj))
+            if current is None:
+                to_create.append(obj)
+                continue
+            changed = False
+            for field in self.update_fields:
+                if getattr(current, field) != getattr(obj, field):
+                    setattr(current, field, getattr(obj, field))
+                    changed = True
+            if changed:
+                to_update.append(current)
+        self.model.objects.bulk_create(to_create, ignore_conflicts=True)
+        if to_update and self.update_fields:
+            self.model.objects.bulk_update(to_update, self.update_fields)
+
+    def copy_batch(self, objs):
+        """Загрузка пачки через COPY и INSERT ... ON CONFLICT."""
+        table = self.model._meta.db_table
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in self.fields)
+        keys = ', '.join(
+            quote(self.model._meta.get_field(field).column)
+            for field in self.unique_fields
+        )
+        updates = [
+            quote(self.model._meta.get_field(field).column)
+            for field in self.update_fields
+        ]
+        if updates:
+            conflict = (
+                'DO UPDATE SET {} WHERE ({}) IS DISTINCT FROM ({})'
+            ).format(
+                ', '.join(f'{column} = EXCLUDED.{column}'
+                          for column in updates),
+                ', '.join(f'{quote(table)}.{column}' for column in updates),
+                ', '.join(f'EXCLUDED.{column}' for column in updates),
+            )
+        else:
+            conflict = 'DO NOTHING'
+        buffer = io.StringIO()
+        for obj in objs:
+            buffer.write(','.join(
+                copy_value(field.get_db_prep_save(
+                    getattr(obj, field.attname), connection
+                ))
+                for field in self.fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE loadcsv_batch ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {quote(table)} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY loadcsv_batch ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {quote(table)} ({columns}) '
+                f'SELECT {columns} FROM loadcsv_batch '
+                f'ON CONFLICT ({keys}) {conflict}'
+            )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета счетчиков избранного, корзин, рецептов
+    и подписчиков, разошедшихся с фактическими данными.
+    Запуск:
+    python manage.py reconcile_counters
+    """
+    help = 'Пересчитывает денормализованные счетчики'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='objects per update')
+
+    def handle(self, *args, **kwargs):
+        for model, field, fixed in reconcile_counters(kwargs['batch_size']):
+            self.stdout.write(
+                f'{model._meta.label}.{field}: fixed {fixed} objects'
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    """
+    Команда для расчета похожих рецептов по ингредиентам и тэгам,
+    запускается периодически, полный пересчет - реже инкрементального.
+    Запуск:
+    python manage.py update_similar_recipes
+    python manage.py update_similar_recipes --incremental
+    """
+    help = 'Рассчитывает похожие рецепты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='recompute only recipes affected by changes')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='recipes per transaction')
+
+    def handle(self, *args, **kwargs):
+        updated = update_similar_recipes(
+            kwargs['incremental'], kwargs['batch_size']
+        )
+        self.stdout.write(f'Updated similar recipes of {updated} recipes')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import update_trending_scores
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета рейтинга популярности рецептов за последнее
+    время, запускается периодически.
+    Запуск:
+    python manage.py update_trending_scores
+    """
+    help = 'Пересчитывает рейтинг популярности рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='objects per update')
+
+    def handle(self, *args, **kwargs):
+        updated = update_trending_scores(kwargs['batch_size'])
+        self.stdout.write(f'Updated {updated} recipes')
@@ -0,0 +1,126 @@
+from django.db import connections, models, router
+from django.db.models.signals import post_delete, post_save
+
+
+class RelationManager(models.Manager):
+    """
+    Менеджер связей пользователя с рецептом или автором, уникальных
+    по ограничению модели: избранное, корзина, подписки.
+    Добавление и удаление выполняются одним запросом INSERT ... ON
+    CONFLICT DO NOTHING RETURNING и DELETE ... RETURNING, поэтому
+    одновременные запросы не создают дубликатов. Методы add и remove
+    отправляют сигналы post_save и post_delete вручную.
+    Массовые add_many и remove_many выполняются в обход сигналов модели:
+    счетчики, версии кэша и списки покупок не обновляются, вызывающий
+    код должен передать результат в api.signals.relations_bulk_changed.
+    """
+
+    def _connection(self):
+        """
+        Соединение с базой для записи. Псевдоним базы не сохраняется
+        в менеджере: менеджер общий для модели, и остальные запросы
+        через него не должны переключаться на базу для записи.
+        """
+        return connections[router.db_for_write(self.model)]
+
+    def _returning(self, cursor, using):
+        """Объекты базы using из строк, возвращенных RETURNING."""
+        attnames = [
+            field.attname for field in self.model._meta.concrete_fields
+        ]
+        return [
+            self.model.from_db(using, attnames, row)
+            for row in cursor.fetchall()
+        ]
+
+    def add_many(self, objs):
+        """
+        Создание связей objs без отправки сигналов. Возвращает
+        созданные связи.
+        """
+        if not objs:
+            return []
+        connection = self._connection()
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        fields = [
+            field for field in opts.concrete_fields if not field.primary_key
+        ]
+        row = '({})'.format(', '.join(['%s'] * len(fields)))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING '
+                'RETURNING {}'.format(
+                    quote(opts.db_table),
+                    ', '.join(quote(field.column) for field in fields),
+                    ', '.join([row] * len(objs)),
+                    ', '.join(
+                        quote(field.column) for field in opts.concrete_fields
+                    ),
+                ),
+                [
+                    field.get_db_prep_save(
+                        field.pre_save(obj, add=True), connection
+                    )
+                    for obj in objs for field in fields
+                ]
+            )
+            return self._returning(cursor, connection.alias)
+
+    def remove_many(self, **values):
+        """
+        Удаление связей по значениям полей без отправки сигналов,
+        значение-список сравнивается через IN. Возвращает удаленные
+        связи.
+        """
+        connection = self._connection()
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        conditions = []
+        params = []
+        for name, value in values.items():
+            field = opts.get_field(name)
+            if isinstance(value, (list, tuple, set)):
+                if not value:
+                    return []
+                conditions.append('{} IN ({})'.format(
+                    quote(field.column), ', '.join(['%s'] * len(value))
+                ))
+            else:
+                conditions.append(f'{quote(field.column)} = %s')
+                value = (value,)
+            params.extend(
+                field.get_db_prep_value(getattr(item, 'pk', item), connection)
+                for item in value
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE {} RETURNING {}'.format(
+                    quote(opts.db_table),
+                    ' AND '.join(conditions),
+                    ', '.join(
+                        quote(field.column) for field in opts.concrete_fields
+                    ),
+                ),
+                params
+            )
+            return self._returning(cursor, connection.alias)
+
+    def add(self, **values):
+        """Создание связи. Возвращает None, если связь уже существует."""
+        for obj in self.add_many([self.model(**values)]):
+            post_save.send(
+                sender=self.model, instance=obj, created=True,
+                update_fields=None, raw=False, using=obj._state.db
+            )
+            return obj
+        return None
+
+    def remove(self, **values):
+        """Удаление связи. Возвращает None, если связи не было."""
+        for obj in self.remove_many(**values):
+            post_delete.send(
+                sender=self.model, instance=obj, using=obj._state.db
+            )
+            return obj
+        return None
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:26
+
+from django.db import migrations, models
+import django.db.models.functions.text
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        others = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=duplicate['keep_id'])
+        IngredientInRecipe.objects.filter(ingredient__in=others).update(
+            ingredient_id=duplicate['keep_id']
+        )
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        # SQLite пересоздает таблицу при добавлении ограничения и не может
+        # скопировать индекс по выражению, поэтому он создается заново.
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_lower_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='ingredient_name_lower_idx'),
+        ),
+    ]
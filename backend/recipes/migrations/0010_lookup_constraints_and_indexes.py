@@ -0,0 +1,79 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:34
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(
+                fk
+            ).annotate(count=Count('pk')).values('count')
+        ),
+        0
+    )
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            keep_id=Min('id'), count=Count('id')
+        ).filter(count__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                user=duplicate['user'], recipe=duplicate['recipe']
+            ).exclude(id=duplicate['keep_id']).delete()
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    duplicates = IngredientInRecipe.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        keep_id=Min('id'), count=Count('id'), amount=Sum('amount')
+    ).filter(count__gt=1)
+    for duplicate in duplicates:
+        IngredientInRecipe.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient']
+        ).exclude(id=duplicate['keep_id']).delete()
+        IngredientInRecipe.objects.filter(id=duplicate['keep_id']).update(
+            amount=duplicate['amount']
+        )
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count(apps.get_model('recipes', 'Favorite'), 'recipe'),
+        in_carts_count=count(
+            apps.get_model('recipes', 'ShoppingCart'), 'recipe'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at', 'favorites_count'], name='recipe_validators_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['slug', 'id'], name='tag_slug_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_ingredient_in_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
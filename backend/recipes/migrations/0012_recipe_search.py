@@ -0,0 +1,96 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import recipes.models
+
+POSTGRESQL_FORWARD = (
+    "ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector "
+    "tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_FORWARD = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5("
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    'INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rank) '
+    "VALUES ('rank', 'bm25(10.0, 1.0)')",
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) VALUES ('rebuild')",
+)
+
+SQLITE_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Полнотекстовый индекс рецептов по названию и описанию.
+    На PostgreSQL - вычисляемый столбец tsvector с русской морфологией и
+    GIN-индекс, на SQLite - таблица FTS5, которую поддерживают триггеры.
+    Оба индекса обновляются базой данных при каждой записи рецепта.
+    Пересоздание таблицы рецептов миграциями на SQLite удаляет триггеры,
+    их восстанавливает обработчик post_migrate из recipes.fts.
+    """
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchIndex',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='recipes.recipe')),
+                ('document', recipes.models.SearchDocumentField(db_column='recipes_recipe_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(
+            execute({
+                'postgresql': POSTGRESQL_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            execute({
+                'postgresql': POSTGRESQL_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Индекс (tag_id, recipe_id) таблицы связи рецептов и тэгов для
+    фильтрации по тэгам со стороны тэга. Таблица создается Django
+    автоматически, поэтому индекс добавляется SQL-запросом.
+    """
+
+    dependencies = [
+        ('recipes', '0012_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_validators_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at', 'favorites_count', 'trending_score'], name='recipe_validators_idx'),
+        ),
+    ]
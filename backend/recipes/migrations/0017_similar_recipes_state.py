@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_validators_trending_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipesState',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similar_recipes_state', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчета')),
+            ],
+            options={
+                'verbose_name': 'Расчет похожих рецептов',
+                'verbose_name_plural': 'Расчеты похожих рецептов',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+class CounterFieldsMixin:
+    """
+    Модель со счетчиками, которые изменяются только атомарно выражениями
+    F() в базе данных. Сохранение существующего объекта без update_fields
+    не записывает поля counter_fields: значения, прочитанные до
+    сохранения, могли устареть и затерли бы изменения счетчиков.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(force_insert, force_update, using, update_fields)
@@ -1,7 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.core import validators
 from django.db import models
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.functions import Lower, RowNumber
 
+from recipes.managers import RelationManager
+from recipes.mixins import CounterFieldsMixin
 from recipes.validators import webcolors_validate
 
 User = get_user_model()
@@ -33,6 +38,9 @@ class Tag(models.Model):
         ordering = ('name',)
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
+        indexes = [
+            models.Index(fields=['slug', 'id'], name='tag_slug_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -55,12 +63,87 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(Lower('name'), name='ingredient_name_lower_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'], name='unique_ingredient',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+def recipe_related_lookups(user):
+    """
+    Связанные объекты рецепта для prefetch_related. Автор аннотируется
+    признаком подписки на него пользователя user.
+    """
+    return (
+        Prefetch('author', queryset=User.objects.with_subscription(user)),
+        'tags',
+        Prefetch(
+            'ingredient_in_recipe',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для выдачи через API."""
+
+    def with_related(self, user):
+        """
+        Подгрузка связанных объектов рецепта фиксированным числом запросов.
+        """
+        return self.prefetch_related(*recipe_related_lookups(user))
+
+    def with_user_flags(self, user):
+        """
+        Аннотирование признаков нахождения рецепта в избранном и корзине
+        пользователя user.
+        """
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            )),
+        )
+
+    def latest_by_author(self, authors, limit):
+        """
+        Не более limit последних рецептов каждого из авторов authors.
+        Рецепты нумеруются оконной функцией ROW_NUMBER в разрезе автора,
+        срез выполняется одним запросом на стороне базы данных. Для
+        пустого списка авторов запрос не выполняется.
+        """
+        if not authors:
+            return self.none()
+        ranked = self.filter(author__in=authors).annotate(
+            author_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE author_rank <= %s '
+            'ORDER BY author_id, author_rank',
+            (*params, limit),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Recipe model."""
     name = models.CharField(
         'Название рецепта',
@@ -71,6 +154,11 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='media/',
     )
+    image_variants = models.JSONField(
+        'Уменьшенные варианты изображения',
+        default=dict,
+        editable=False,
+    )
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         verbose_name='Автор',
@@ -101,11 +189,73 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлено в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлено в корзину',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        'Рейтинг популярности за последнее время',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count', 'trending_score')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'], name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'], name='recipe_trending_idx',
+            ),
+            models.Index(
+                fields=['updated_at', 'favorites_count', 'trending_score'],
+                name='recipe_validators_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'], name='recipe_cooking_time_idx',
+            ),
+            models.Index(fields=['name', 'id'], name='recipe_name_idx'),
+            models.Index(
+                fields=['author', 'cooking_time', 'id'],
+                name='recipe_author_cooking_idx',
+            ),
+            models.Index(
+                fields=['author', 'name', 'id'],
+                name='recipe_author_name_idx',
+            ),
+            models.Index(
+                fields=['author', '-favorites_count', '-id'],
+                name='recipe_author_popular_idx',
+            ),
+            models.Index(
+                fields=['author', '-trending_score', '-id'],
+                name='recipe_author_trending_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['name', 'author'], name='unique_recipe',
@@ -116,6 +266,41 @@ class Recipe(models.Model):
         return self.name
 
 
+class SearchDocumentField(models.TextField):
+    """Скрытый столбец таблицы FTS5 с именем таблицы для оператора MATCH."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class RecipeSearchIndex(models.Model):
+    """
+    Полнотекстовый индекс рецептов FTS5 на SQLite. Таблица и триггеры,
+    которые ее обновляют, создаются миграцией 0012_recipe_search.
+    Столбец rank - релевантность совпадения (чем меньше, тем лучше).
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+    )
+    document = SearchDocumentField(db_column='recipes_recipe_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+
+
 class IngredientInRecipe(models.Model):
     """IngredientInRecipe model."""
     ingredient = models.ForeignKey(
@@ -141,6 +326,12 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_ingredient_in_recipe',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient_id} - {self.recipe_id}'
@@ -159,10 +350,22 @@ class Favorite(models.Model):
         verbose_name='Пользователь',
         related_name='favorite'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    objects = RelationManager()
 
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_favorite',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user_id} - {self.recipe_id}'
@@ -181,10 +384,83 @@ class ShoppingCart(models.Model):
         verbose_name='Пользователь',
         related_name='shopping_cart'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    objects = RelationManager()
 
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_shopping_cart',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user_id} - {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт с коэффициентом сходства по ингредиентам и тэгам.
+    Рассчитывается командой update_similar_recipes.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='similar_to'
+    )
+    score = models.FloatField('Сходство')
+    computed_at = models.DateTimeField('Дата расчета')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score', '-similar'],
+                name='similar_recipe_score_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.similar_id}'
+
+
+class SimilarRecipesState(models.Model):
+    """
+    Дата последнего расчета похожих рецептов для рецепта, в том числе
+    для рецептов, у которых похожих не нашлось.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='similar_recipes_state'
+    )
+    computed_at = models.DateTimeField('Дата расчета')
+
+    class Meta:
+        verbose_name = 'Расчет похожих рецептов'
+        verbose_name_plural = 'Расчеты похожих рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.computed_at}'
@@ -0,0 +1,186 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from recipes.models import (IngredientInRecipe, Recipe, SimilarRecipe,
+                            SimilarRecipesState)
+
+
+class RecipeVectors:
+    """
+    Рецепты как разреженные векторы: единичный вес у каждого ингредиента
+    и вес SIMILAR_RECIPES_TAG_WEIGHT у каждого тэга рецепта. Для поиска
+    кандидатов строится инвертированный индекс по ингредиентам.
+    """
+
+    def __init__(self):
+        self.ingredients = defaultdict(set)
+        self.tags = defaultdict(set)
+        self.postings = defaultdict(list)
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator():
+            self.ingredients[recipe_id].add(ingredient_id)
+            self.postings[ingredient_id].append(recipe_id)
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator():
+            self.tags[recipe_id].add(tag_id)
+        self.tag_weight = settings.SIMILAR_RECIPES_TAG_WEIGHT ** 2
+        self.max_candidates = settings.SIMILAR_RECIPES_MAX_CANDIDATES
+
+    def norm(self, recipe_id):
+        return math.sqrt(
+            len(self.ingredients[recipe_id])
+            + self.tag_weight * len(self.tags[recipe_id])
+        )
+
+    def candidates(self, recipe_id):
+        """
+        Рецепты с общими с рецептом ингредиентами, собранные от редких
+        ингредиентов к частым, пока их не больше
+        SIMILAR_RECIPES_MAX_CANDIDATES. Рецепты с самым редким
+        ингредиентом берутся всегда. Рецепты, у которых общие с рецептом
+        только частые ингредиенты, могут не попасть в кандидаты: так
+        расчет для рецепта не просматривает длинные списки рецептов
+        с солью или водой.
+        """
+        candidates = set()
+        ingredients = sorted(
+            self.ingredients[recipe_id],
+            key=lambda ingredient_id: len(self.postings[ingredient_id])
+        )
+        for ingredient_id in ingredients:
+            posting = self.postings[ingredient_id]
+            if (candidates
+                    and len(candidates) + len(posting) > self.max_candidates):
+                break
+            candidates.update(posting)
+        candidates.discard(recipe_id)
+        return candidates
+
+    def similarities(self, recipe_id):
+        """Косинусное сходство рецепта с рецептами-кандидатами."""
+        ingredients = self.ingredients[recipe_id]
+        tags = self.tags[recipe_id]
+        norm = self.norm(recipe_id)
+        return {
+            other_id: (
+                len(ingredients & self.ingredients[other_id])
+                + self.tag_weight * len(tags & self.tags[other_id])
+            ) / (norm * self.norm(other_id))
+            for other_id in self.candidates(recipe_id)
+        }
+
+
+def nearest(similarities, limit):
+    """Не более limit самых похожих рецептов, при равенстве - новее."""
+    return heapq.nlargest(
+        limit, similarities.items(), key=lambda item: (item[1], item[0])
+    )
+
+
+def chunks(ids, size):
+    """Идентификаторы ids частями не больше size для условий IN."""
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def changed_recipe_ids():
+    """
+    Рецепты без расчета похожих и рецепты, измененные после расчета.
+    """
+    return set(Recipe.objects.filter(
+        Q(similar_recipes_state__isnull=True)
+        | Q(updated_at__gt=F('similar_recipes_state__computed_at'))
+    ).values_list('id', flat=True))
+
+
+def affected_recipe_ids(changed, similarities, limit, batch_size):
+    """
+    Рецепты, чьи списки похожих могли измениться из-за рецептов changed:
+    сами измененные, рецепты со ссылкой на них и рецепты-кандидаты,
+    в список которых измененный рецепт теперь попадает по сходству.
+    """
+    affected = set(changed)
+    candidates = set()
+    for recipe_id in changed:
+        candidates.update(similarities[recipe_id])
+    thresholds = {}
+    for batch in chunks(changed, batch_size):
+        affected.update(SimilarRecipe.objects.filter(
+            similar_id__in=batch
+        ).values_list('recipe_id', flat=True))
+    for batch in chunks(candidates, batch_size):
+        thresholds.update(
+            (row['recipe_id'], row['min_score'])
+            for row in SimilarRecipe.objects.filter(
+                recipe_id__in=batch
+            ).values('recipe_id').annotate(
+                count=Count('id'), min_score=Min('score')
+            ).filter(count__gte=limit)
+        )
+    for recipe_id in changed:
+        for other_id, score in similarities[recipe_id].items():
+            if score > thresholds.get(other_id, 0):
+                affected.add(other_id)
+    return affected
+
+
+def update_similar_recipes(incremental=False, batch_size=1000):
+    """
+    Пересчет таблицы похожих рецептов: для каждого рецепта сохраняются
+    SIMILAR_RECIPES_LIMIT ближайших по косинусному сходству среди
+    кандидатов с общими ингредиентами. Дата расчета сохраняется для
+    каждого рецепта, даже без похожих. В режиме incremental
+    пересчитываются только рецепты, измененные после прошлого расчета,
+    и рецепты, на списки которых они влияют. Удаленные рецепты пропадают
+    из списков сразу, а освободившиеся места заполняются при полном
+    пересчете. Возвращает количество пересчитанных рецептов.
+    """
+    computed_at = timezone.now()
+    limit = settings.SIMILAR_RECIPES_LIMIT
+    vectors = RecipeVectors()
+    similarities = {}
+    if incremental:
+        changed = changed_recipe_ids()
+        for recipe_id in changed:
+            similarities[recipe_id] = vectors.similarities(recipe_id)
+        recipe_ids = affected_recipe_ids(
+            changed, similarities, limit, batch_size
+        )
+    else:
+        recipe_ids = set(Recipe.objects.values_list('id', flat=True))
+    for batch in chunks(recipe_ids, batch_size):
+        rows = []
+        for recipe_id in batch:
+            recipe_similarities = similarities.pop(recipe_id, None)
+            if recipe_similarities is None:
+                recipe_similarities = vectors.similarities(recipe_id)
+            rows.extend(
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score,
+                    computed_at=computed_at,
+                )
+                for similar_id, score in nearest(recipe_similarities, limit)
+            )
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows, batch_size)
+            SimilarRecipesState.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipesState.objects.bulk_create(
+                (
+                    SimilarRecipesState(
+                        recipe_id=recipe_id, computed_at=computed_at
+                    )
+                    for recipe_id in batch
+                ),
+                batch_size,
+            )
+    return len(recipe_ids)
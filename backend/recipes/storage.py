@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    Файловое хранилище с именами файлов по хэшу содержимого.
+    Одинаковые файлы сохраняются один раз, а имя, и вместе с ним ссылка,
+    меняется только вместе с содержимым, поэтому файлы можно кэшировать
+    без срока давности. Неиспользуемые файлы удаляет команда
+    collect_media_garbage.
+    """
+
+    def hashed_name(self, name, content):
+        """Имя файла: каталог и расширение name, имя - sha256 содержимого."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, f'{digest.hexdigest()}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,120 @@
+import csv
+import io
+import os
+import random
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe, User
+
+INGREDIENTS_FILE = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv'
+)
+TAGS_FILE = os.path.join(settings.BASE_DIR, 'static', 'data', 'tags.csv')
+
+USERS_COUNT = 50
+RECIPES_COUNT = 3000
+INGREDIENTS_PER_RECIPE = 6
+TAGS_PER_RECIPE = 2
+SUBSCRIPTIONS_COUNT = 20
+FAVORITES_COUNT = 200
+SHOPPING_CART_COUNT = 30
+
+
+def seed_database():
+    """
+    Наполнение базы данных объемом, близким к рабочему: полный справочник
+    ингредиентов, тысячи рецептов, подписки, избранное и корзина.
+    """
+    rand = random.Random(0)
+    with open(INGREDIENTS_FILE, encoding='utf-8') as csv_file:
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in csv.reader(csv_file)
+        )
+    with open(TAGS_FILE, encoding='utf-8-sig') as csv_file:
+        Tag.objects.bulk_create(
+            Tag(**row) for row in csv.DictReader(csv_file)
+        )
+    User.objects.bulk_create(
+        User(
+            username=f'user{num}',
+            email=f'user{num}@foodgram.fake',
+            first_name=f'Имя{num}',
+            last_name=f'Фамилия{num}',
+        ) for num in range(USERS_COUNT)
+    )
+    ingredients = list(Ingredient.objects.order_by('id'))
+    tags = list(Tag.objects.order_by('id'))
+    users = list(User.objects.order_by('id'))
+    Recipe.objects.bulk_create(
+        Recipe(
+            name=f'Рецепт {num}',
+            text=f'Описание рецепта {num}',
+            image='media/seed.jpg',
+            cooking_time=rand.randint(1, 180),
+            author=users[num % USERS_COUNT],
+        ) for num in range(RECIPES_COUNT)
+    )
+    recipes = list(Recipe.objects.order_by('id'))
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(
+            recipe=recipe, ingredient=ingredient,
+            amount=rand.randint(1, 500),
+        )
+        for recipe in recipes
+        for ingredient in rand.sample(ingredients, INGREDIENTS_PER_RECIPE)
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in rand.sample(tags, TAGS_PER_RECIPE)
+    )
+    user = users[0]
+    Subscribe.objects.bulk_create(
+        Subscribe(user=user, author=author)
+        for author in users[1:SUBSCRIPTIONS_COUNT + 1]
+    )
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe=recipe)
+        for recipe in rand.sample(recipes, FAVORITES_COUNT)
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe)
+        for recipe in rand.sample(recipes, SHOPPING_CART_COUNT)
+    )
+    call_command('reconcile_counters', stdout=io.StringIO())
+    return {
+        'user': user,
+        'token': Token.objects.create(user=user),
+        'users': users,
+        'recipes': recipes,
+        'tags': tags,
+        'ingredients': ingredients,
+    }
+
+
+@pytest.fixture(scope='module')
+def seeded_db(django_db_setup, django_db_blocker):
+    """
+    Однократное наполнение базы данных на модуль тестов.
+    Данные откатываются по завершении модуля.
+    """
+    with django_db_blocker.unblock():
+        with transaction.atomic():
+            yield seed_database()
+            transaction.set_rollback(True)
+
+
+@pytest.fixture
+def seeded_client(seeded_db):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {seeded_db["token"].key}')
+    return client
@@ -0,0 +1,306 @@
+import base64
+import json
+import time
+from http import HTTPStatus
+from urllib.parse import urlencode
+
+import pytest
+
+from recipes.models import Recipe
+from tests.utils import recipe_payload
+
+MAX_RESPONSE_TIME = 1.0
+RECIPE_CREATE_MAX_QUERIES = 22
+RECIPE_UPDATE_MAX_QUERIES = 20
+
+READ_ENDPOINTS = [
+    ('/api/tags/', 2),
+    ('/api/tags/{tag_id}/', 2),
+    ('/api/ingredients/', 2),
+    ('/api/ingredients/?name=кар', 2),
+    ('/api/ingredients/{ingredient_id}/', 2),
+    ('/api/recipes/', 7),
+    ('/api/recipes/?limit=50', 7),
+    ('/api/recipes/?page=100', 7),
+    ('/api/recipes/?ordering=popular', 7),
+    ('/api/recipes/?ordering=trending', 7),
+    ('/api/recipes/?ordering=popular&cursor=', 6),
+    ('/api/recipes/?ordering=cooking_time', 7),
+    ('/api/recipes/?ordering=-cooking_time&cursor=', 6),
+    ('/api/recipes/?ordering=name', 7),
+    ('/api/recipes/?ordering=-name&cursor=', 6),
+    ('/api/recipes/?ordering=pub_date', 7),
+    ('/api/recipes/?cooking_time_max=30', 7),
+    ('/api/recipes/?cooking_time_min=30&cooking_time_max=60'
+     '&ordering=cooking_time', 7),
+    ('/api/recipes/?tags=dinner&cooking_time_max=30&ordering=cooking_time',
+     8),
+    ('/api/recipes/?author={author_id}&ordering=cooking_time', 8),
+    ('/api/recipes/?author={author_id}&cooking_time_max=60'
+     '&ordering=cooking_time&cursor=', 7),
+    ('/api/recipes/?author={author_id}&ordering=name', 8),
+    ('/api/recipes/?author={author_id}&ordering=popular', 8),
+    ('/api/recipes/?author={author_id}&ordering=trending', 8),
+    ('/api/recipes/?author={author_id}&ordering=pub_date', 8),
+    ('/api/recipes/?cursor=', 6),
+    ('/api/recipes/?cursor=&limit=50', 6),
+    ('/api/recipes/?search=рецепт+12', 7),
+    ('/api/recipes/?search=рецепт&cursor=', 6),
+    ('/api/recipes/?is_favorited=1', 7),
+    ('/api/recipes/?is_in_shopping_cart=1', 7),
+    ('/api/recipes/?tags=breakfast&tags=lunch', 8),
+    ('/api/recipes/?tags=breakfast&tags=lunch&tags_mode=all', 8),
+    ('/api/recipes/?author={author_id}', 8),
+    ('/api/recipes/{recipe_id}/', 6),
+    ('/api/recipes/{recipe_id}/similar/', 3),
+    ('/api/recipes/feed/', 7),
+    ('/api/recipes/download_shopping_cart/', 3),
+    ('/api/recipes/download_shopping_cart/?format=txt', 3),
+    ('/api/recipes/download_shopping_cart/?format=csv', 3),
+    ('/api/recipes/download_shopping_cart/?format=json', 3),
+    ('/api/users/', 3),
+    ('/api/users/{author_id}/', 2),
+    ('/api/users/me/', 2),
+    ('/api/users/subscriptions/', 4),
+    ('/api/users/subscriptions/?recipes_limit=3', 4),
+    ('/api/users/subscriptions/?cursor=', 3),
+]
+
+WRITE_ENDPOINTS = [
+    ('post', '/api/recipes/{recipe_id}/favorite/', HTTPStatus.CREATED, 4),
+    ('delete', '/api/recipes/{recipe_id}/favorite/', HTTPStatus.NO_CONTENT,
+     3),
+    ('post', '/api/recipes/{cart_recipe_id}/shopping_cart/',
+     HTTPStatus.CREATED, 4),
+    ('delete', '/api/recipes/{cart_recipe_id}/shopping_cart/',
+     HTTPStatus.NO_CONTENT, 3),
+    ('post', '/api/users/{other_author_id}/subscribe/', HTTPStatus.CREATED,
+     5),
+    ('delete', '/api/users/{author_id}/subscribe/', HTTPStatus.NO_CONTENT,
+     3),
+]
+
+
+def format_url(url, seeded_db):
+    user = seeded_db['user']
+    return url.format(
+        tag_id=seeded_db['tags'][0].id,
+        ingredient_id=seeded_db['ingredients'][0].id,
+        recipe_id=user.favorite.first().recipe_id,
+        cart_recipe_id=user.shopping_cart.first().recipe_id,
+        author_id=user.subscriber.first().author_id,
+        other_author_id=seeded_db['users'][-1].id,
+    )
+
+
+def timed_request(method, url, **kwargs):
+    start = time.perf_counter()
+    response = method(url, **kwargs)
+    return response, time.perf_counter() - start
+
+
+@pytest.mark.django_db
+class Test01QueryPerformance:
+
+    @pytest.mark.parametrize('url,max_queries', READ_ENDPOINTS)
+    def test_01_read_endpoints(self, seeded_db, seeded_client, url,
+                               max_queries, django_assert_max_num_queries):
+        url = format_url(url, seeded_db)
+        with django_assert_max_num_queries(max_queries):
+            response, duration = timed_request(seeded_client.get, url)
+        assert response.status_code == HTTPStatus.OK, (
+            f'GET-запрос к `{url}` должен вернуть ответ со статусом 200.'
+        )
+        assert duration < MAX_RESPONSE_TIME, (
+            f'GET-запрос к `{url}` выполнялся {duration:.3f} с, допустимо '
+            f'не более {MAX_RESPONSE_TIME} с.'
+        )
+
+    @pytest.mark.parametrize(
+        'method,url,expected_status,max_queries', WRITE_ENDPOINTS
+    )
+    def test_01_write_endpoints(self, seeded_db, seeded_client, method, url,
+                                expected_status, max_queries,
+                                django_assert_max_num_queries):
+        url = format_url(url, seeded_db)
+        if method == 'post':
+            seeded_client.delete(url)
+        with django_assert_max_num_queries(max_queries):
+            response, duration = timed_request(
+                getattr(seeded_client, method), url
+            )
+        assert response.status_code == expected_status, (
+            f'{method.upper()}-запрос к `{url}` должен вернуть ответ со '
+            f'статусом {expected_status}.'
+        )
+        assert duration < MAX_RESPONSE_TIME, (
+            f'{method.upper()}-запрос к `{url}` выполнялся {duration:.3f} с, '
+            f'допустимо не более {MAX_RESPONSE_TIME} с.'
+        )
+
+    def test_01_recipe_page_size_does_not_change_queries(
+            self, seeded_client, django_assert_num_queries):
+        with django_assert_num_queries(7):
+            seeded_client.get('/api/recipes/?limit=1')
+        with django_assert_num_queries(7):
+            seeded_client.get('/api/recipes/?limit=100')
+
+    @pytest.mark.parametrize('url,count', (
+        ('/api/recipes/?cursor=&limit=100', 3000),
+        ('/api/users/subscriptions/?cursor=&limit=3', 20),
+    ))
+    def test_01_cursor_pagination(self, seeded_client, url, count,
+                                  django_assert_max_num_queries):
+        ids = []
+        while url:
+            with django_assert_max_num_queries(6):
+                response = seeded_client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            data = response.json()
+            assert 'count' not in data, (
+                'Курсорная пагинация не должна подсчитывать общее '
+                'количество объектов.'
+            )
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        assert len(ids) == len(set(ids)) == count, (
+            'Обход всех страниц курсорной пагинации должен вернуть каждый '
+            'объект ровно один раз.'
+        )
+
+    @pytest.mark.parametrize('url,position', (
+        ('/api/recipes/?ordering=popular', ['abc', '1']),
+        ('/api/recipes/?ordering=pub_date', ['2020-13-45 10:00', '1']),
+        ('/api/recipes/?ordering=pub_date', ['дата', '1']),
+        ('/api/recipes/?search=рецепт', ['abc', '1']),
+        ('/api/recipes/?ordering=popular', ['1']),
+        ('/api/recipes/feed/?limit=5', ['2020-13-45 10:00', '1']),
+        ('/api/users/subscriptions/?limit=5', ['x']),
+    ))
+    def test_01_cursor_pagination_invalid_position(self, seeded_client, url,
+                                                   position):
+        cursor = base64.b64encode(
+            urlencode({'p': json.dumps(position)}).encode()
+        ).decode()
+        response = seeded_client.get(f'{url}&cursor={cursor}')
+        assert response.status_code == HTTPStatus.NOT_FOUND, (
+            f'GET-запрос к `{url}` с недействительной позицией курсора '
+            'должен вернуть ответ со статусом 404.'
+        )
+
+    def test_01_cursor_pagination_with_ties(self, seeded_client,
+                                            django_assert_max_num_queries):
+        expected = list(Recipe.objects.order_by(
+            '-favorites_count', '-id'
+        ).values_list('id', flat=True))
+        url = '/api/recipes/?ordering=popular&cursor=&limit=100'
+        pages = []
+        while url:
+            with django_assert_max_num_queries(6) as captured:
+                data = seeded_client.get(url).json()
+            assert not [
+                query for query in captured.captured_queries
+                if ' OFFSET ' in query['sql']
+            ], (
+                'Курсорная пагинация должна выбирать страницы условием по '
+                'полям сортировки и первичному ключу, без OFFSET.'
+            )
+            pages.append([item['id'] for item in data['results']])
+            previous, url = data['previous'], data['next']
+        assert sum(pages, []) == expected, (
+            'Обход страниц курсорной пагинации должен вернуть все рецепты '
+            'в порядке сортировки, в том числе с равным значением поля.'
+        )
+        for page in reversed(pages[:-1]):
+            data = seeded_client.get(previous).json()
+            assert [item['id'] for item in data['results']] == page
+            previous = data['previous']
+        assert previous is None
+
+    @pytest.mark.parametrize(
+        'url', ('/api/recipes/', '/api/recipes/{recipe_id}/')
+    )
+    def test_01_recipes_conditional_get(self, seeded_db, seeded_client, url,
+                                        django_assert_max_num_queries):
+        url = format_url(url, seeded_db)
+        response = seeded_client.get(url)
+        with django_assert_max_num_queries(2):
+            not_modified = seeded_client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        assert not_modified.status_code == HTTPStatus.NOT_MODIFIED, (
+            f'GET-запрос к `{url}` с актуальным If-None-Match должен вернуть '
+            'ответ со статусом 304.'
+        )
+        recipe_id = seeded_db['user'].favorite.first().recipe_id
+        seeded_client.delete(f'/api/recipes/{recipe_id}/favorite/')
+        response = seeded_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == HTTPStatus.OK, (
+            f'После изменения избранного GET-запрос к `{url}` должен вернуть '
+            'актуальные данные.'
+        )
+
+    @pytest.mark.parametrize('url', ('/api/tags/', '/api/ingredients/'))
+    def test_01_reference_data_cached(self, seeded_client, url,
+                                      django_assert_num_queries):
+        response = seeded_client.get(url)
+        with django_assert_num_queries(1):
+            cached_response = seeded_client.get(url)
+        assert cached_response.content == response.content, (
+            f'Повторный GET-запрос к `{url}` должен возвращать те же данные '
+            'из кэша.'
+        )
+        with django_assert_num_queries(1):
+            response = seeded_client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED, (
+            f'GET-запрос к `{url}` с актуальным If-None-Match должен вернуть '
+            'ответ со статусом 304.'
+        )
+
+    def test_01_download_shopping_cart_cached(self, seeded_client,
+                                              django_assert_num_queries):
+        url = '/api/recipes/download_shopping_cart/'
+        response = seeded_client.get(url)
+        content = b''.join(response.streaming_content)
+        with django_assert_num_queries(2):
+            cached_response = seeded_client.get(url)
+        assert b''.join(cached_response.streaming_content) == content, (
+            f'Повторный GET-запрос к `{url}` должен возвращать тот же файл '
+            'из кэша.'
+        )
+        with django_assert_num_queries(2):
+            response = seeded_client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED, (
+            f'GET-запрос к `{url}` с актуальным If-None-Match должен вернуть '
+            'ответ со статусом 304.'
+        )
+
+    def test_01_recipe_create_and_update(self, seeded_db, seeded_client,
+                                         settings, tmp_path,
+                                         django_assert_max_num_queries):
+        settings.MEDIA_ROOT = tmp_path
+        url = '/api/recipes/'
+        with django_assert_max_num_queries(RECIPE_CREATE_MAX_QUERIES):
+            response, duration = timed_request(
+                seeded_client.post, url,
+                data=recipe_payload(seeded_db, 'Новый рецепт'), format='json'
+            )
+        assert response.status_code == HTTPStatus.CREATED, (
+            f'POST-запрос к `{url}` должен вернуть ответ со статусом 201.'
+        )
+        assert duration < MAX_RESPONSE_TIME
+        url = f'{url}{response.json()["id"]}/'
+        with django_assert_max_num_queries(RECIPE_UPDATE_MAX_QUERIES):
+            response, duration = timed_request(
+                seeded_client.patch, url,
+                data=recipe_payload(seeded_db, 'Другое название'),
+                format='json'
+            )
+        assert response.status_code == HTTPStatus.OK, (
+            f'PATCH-запрос к `{url}` должен вернуть ответ со статусом 200.'
+        )
+        assert duration < MAX_RESPONSE_TIME
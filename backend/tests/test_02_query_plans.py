@@ -0,0 +1,101 @@
+import re
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tests.test_01_query_performance import (READ_ENDPOINTS, WRITE_ENDPOINTS,
+                                             format_url)
+
+SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def sequential_scans(sql):
+    """
+    Полные просмотры таблиц в плане запроса SQLite. Просмотр таблицы
+    в порядке первичного ключа с LIMIT считается допустимым: он
+    останавливается после страницы выдачи.
+    """
+    tables = set(connection.introspection.table_names())
+    scans = []
+    for detail in query_plan(sql):
+        match = SCAN_RE.match(detail)
+        if not match or match.group(1) not in tables:
+            continue
+        table = match.group(1)
+        if f'ORDER BY "{table}"."id" ASC LIMIT' in sql:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def assert_no_sequential_scans(queries, url):
+    for query in queries:
+        sql = query['sql']
+        if not sql.startswith('SELECT'):
+            continue
+        scans = sequential_scans(sql)
+        assert not scans, (
+            f'Запрос к `{url}` выполняет полный просмотр таблицы '
+            f'({", ".join(scans)}), нужен индекс:\n{sql}'
+        )
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'sqlite',
+    reason='Проверяются планы запросов SQLite.'
+)
+@pytest.mark.django_db
+class Test02QueryPlans:
+
+    @pytest.mark.parametrize(
+        'url', [url for url, _ in READ_ENDPOINTS]
+    )
+    def test_02_read_endpoints_use_indexes(self, seeded_db, seeded_client,
+                                           url):
+        url = format_url(url, seeded_db)
+        with CaptureQueriesContext(connection) as context:
+            seeded_client.get(url)
+        assert_no_sequential_scans(context.captured_queries, url)
+
+    @pytest.mark.parametrize('url', [
+        url for url, _ in READ_ENDPOINTS
+        if url.startswith('/api/recipes/?') and 'ordering=' in url
+    ])
+    def test_02_recipe_orderings_use_indexes(self, seeded_db, seeded_client,
+                                             url):
+        url = format_url(url, seeded_db)
+        with CaptureQueriesContext(connection) as context:
+            seeded_client.get(url)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if (not sql.startswith('SELECT') or 'ORDER BY' not in sql
+                    or 'FROM "recipes_recipe" ' not in sql):
+                continue
+            sorts = [
+                detail for detail in query_plan(sql)
+                if detail.startswith('USE TEMP B-TREE')
+                and 'ORDER BY' in detail
+            ]
+            assert not sorts, (
+                f'Запрос к `{url}` сортирует рецепты без индекса, нужен '
+                f'составной индекс по полям сортировки:\n{sql}'
+            )
+
+    @pytest.mark.parametrize(
+        'method,url', [(method, url) for method, url, *_ in WRITE_ENDPOINTS]
+    )
+    def test_02_write_endpoints_use_indexes(self, seeded_db, seeded_client,
+                                            method, url):
+        url = format_url(url, seeded_db)
+        if method == 'post':
+            seeded_client.delete(url)
+        with CaptureQueriesContext(connection) as context:
+            getattr(seeded_client, method)(url)
+        assert_no_sequential_scans(context.captured_queries, url)
@@ -0,0 +1,134 @@
+import base64
+import io
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from PIL import Image
+
+from recipes import images
+from recipes.images import generate_image_variants
+from recipes.models import Recipe
+from tests.utils import recipe_payload
+
+
+def image_payload(size=(800, 600), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+@pytest.mark.django_db
+class Test03RecipeImages:
+
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+
+    def create_recipe(self, seeded_db, seeded_client, name, image):
+        payload = recipe_payload(seeded_db, name)
+        payload['image'] = image
+        return seeded_client.post('/api/recipes/', data=payload,
+                                  format='json')
+
+    def test_03_variants_generated_after_commit(
+            self, seeded_db, seeded_client, settings, monkeypatch,
+            django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = self.create_recipe(
+                seeded_db, seeded_client, 'Рецепт с фото', image_payload()
+            )
+        assert response.status_code == HTTPStatus.CREATED
+        data = response.json()
+        submitted = []
+        monkeypatch.setattr(images, 'get_executor', lambda: SimpleNamespace(
+            submit=lambda function, *args: submitted.append(args)
+        ))
+        for callback in callbacks:
+            callback()
+        assert submitted == [(data['id'],)], (
+            'Обработка изображения должна ставиться в очередь после '
+            'фиксации транзакции.'
+        )
+        assert data['image_thumbnail'] == data['image'], (
+            'Пока варианты изображения не созданы, отдается исходное '
+            'изображение.'
+        )
+        variants = generate_image_variants(data['id'])
+        recipe = Recipe.objects.get(pk=data['id'])
+        assert recipe.image_variants == variants
+        response = seeded_client.get(f'/api/recipes/{data["id"]}/')
+        for variant in ('thumbnail', 'card', 'full'):
+            url = response.json()[f'image_{variant}']
+            assert url.endswith(variants[variant])
+            with recipe.image.storage.open(variants[variant]) as file:
+                image = Image.open(file)
+                width, height = image.size
+            max_width, max_height = settings.RECIPE_IMAGE_VARIANTS[variant]
+            assert width <= max_width and height <= max_height, (
+                f'Вариант `{variant}` должен быть уменьшен до '
+                f'{max_width}x{max_height}.'
+            )
+
+    @pytest.mark.parametrize('image', (
+        'не base64',
+        'data:image/png;base64,aGVsbG8=',
+        image_payload(image_format='BMP'),
+    ))
+    def test_03_invalid_image(self, seeded_db, seeded_client, image):
+        response = self.create_recipe(
+            seeded_db, seeded_client, 'Рецепт с плохим фото', image
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'image' in response.json()
+
+    def test_03_image_size_limit(self, seeded_db, seeded_client, settings):
+        settings.RECIPE_IMAGE_MAX_SIZE = 1024
+        response = self.create_recipe(
+            seeded_db, seeded_client, 'Рецепт с большим фото',
+            image_payload(size=(2000, 2000))
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            'Изображение больше RECIPE_IMAGE_MAX_SIZE должно отклоняться.'
+        )
+        assert 'image' in response.json()
+
+    def test_03_identical_images_stored_once(self, seeded_db, seeded_client):
+        image = image_payload()
+        names = []
+        for name in ('Первый рецепт', 'Второй рецепт'):
+            response = self.create_recipe(seeded_db, seeded_client, name,
+                                          image)
+            names.append(Recipe.objects.get(pk=response.json()['id']).image)
+        assert names[0].name == names[1].name, (
+            'Одинаковые изображения должны сохраняться в один файл.'
+        )
+        url = f'/api/recipes/{response.json()["id"]}/'
+        payload = recipe_payload(seeded_db, 'Второй рецепт')
+        payload['image'] = image_payload(size=(400, 300))
+        seeded_client.patch(url, data=payload, format='json')
+        assert Recipe.objects.get(
+            pk=response.json()['id']
+        ).image.name != names[1].name, (
+            'Имя файла должно меняться вместе с содержимым.'
+        )
+
+    def test_03_collect_media_garbage(self, seeded_db, seeded_client):
+        response = self.create_recipe(
+            seeded_db, seeded_client, 'Рецепт для удаления', image_payload()
+        )
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        variants = generate_image_variants(recipe.pk)
+        storage = recipe.image.storage
+        orphan = storage.save('media/orphan.png', ContentFile(b'orphan'))
+        call_command('collect_media_garbage', min_age=0,
+                     stdout=io.StringIO())
+        assert not storage.exists(orphan), (
+            'Команда collect_media_garbage должна удалять файлы, на которые '
+            'не ссылаются рецепты.'
+        )
+        for name in variants.values():
+            assert storage.exists(name)
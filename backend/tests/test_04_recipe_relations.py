@@ -0,0 +1,295 @@
+import io
+from http import HTTPStatus
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from api.cache import get_feed_timeline
+from api.feed import build_feed_timeline
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+from tests.test_01_query_performance import format_url
+
+
+@pytest.mark.django_db
+class Test04RecipeRelations:
+
+    @pytest.mark.parametrize('url', (
+        '/api/recipes/{recipe_id}/favorite/',
+        '/api/recipes/{cart_recipe_id}/shopping_cart/',
+        '/api/users/{other_author_id}/subscribe/',
+    ))
+    def test_04_toggle_statuses(self, seeded_db, seeded_client, url):
+        url = format_url(url, seeded_db)
+        seeded_client.delete(url)
+        assert seeded_client.post(url).status_code == HTTPStatus.CREATED
+        response = seeded_client.post(url)
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            f'Повторный POST-запрос к `{url}` должен вернуть ответ со '
+            'статусом 400.'
+        )
+        assert 'errors' in response.json()
+        assert seeded_client.delete(url).status_code == HTTPStatus.NO_CONTENT
+        response = seeded_client.delete(url)
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            f'Повторный DELETE-запрос к `{url}` должен вернуть ответ со '
+            'статусом 400.'
+        )
+        missing = url.replace(url.split('/')[3], '999999')
+        for method in (seeded_client.post, seeded_client.delete):
+            assert method(missing).status_code == HTTPStatus.NOT_FOUND, (
+                f'Запрос к `{missing}` должен вернуть ответ со статусом 404.'
+            )
+
+    def test_04_subscribe_to_self(self, seeded_db, seeded_client):
+        url = f'/api/users/{seeded_db["user"].id}/subscribe/'
+        for method in (seeded_client.post, seeded_client.delete):
+            assert method(url).status_code == HTTPStatus.BAD_REQUEST, (
+                f'Запрос к `{url}` должен вернуть ответ со статусом 400.'
+            )
+
+    def test_04_relation_manager_keeps_database(self, seeded_db):
+        user = seeded_db['user']
+        recipe = seeded_db['recipes'][-1]
+        Favorite.objects.remove(user=user, recipe=recipe)
+        added = Favorite.objects.add(user=user, recipe=recipe)
+        removed = Favorite.objects.remove(user=user, recipe=recipe)
+        assert added._state.db == removed._state.db == 'default'
+        assert Favorite.objects._db is None, (
+            'Добавление и удаление связей не должны закреплять общий '
+            'менеджер модели за базой для записи.'
+        )
+
+    def test_04_counters(self, seeded_db, seeded_client):
+        user = seeded_db['user']
+        recipe = seeded_db['recipes'][-1]
+        author = seeded_db['users'][-1]
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        assert recipe.favorites_count == recipe.favorite.count()
+        assert author.recipes_count == author.recipes.count()
+        for url, field in (
+            (f'/api/recipes/{recipe.id}/favorite/', 'favorites_count'),
+            (f'/api/recipes/{recipe.id}/shopping_cart/', 'in_carts_count'),
+        ):
+            seeded_client.delete(url)
+            recipe.refresh_from_db()
+            count = getattr(recipe, field)
+            seeded_client.post(url)
+            recipe.refresh_from_db()
+            assert getattr(recipe, field) == count + 1, (
+                f'POST-запрос к `{url}` должен увеличивать счетчик `{field}`.'
+            )
+            seeded_client.delete(url)
+            recipe.refresh_from_db()
+            assert getattr(recipe, field) == count, (
+                f'DELETE-запрос к `{url}` должен уменьшать счетчик `{field}`.'
+            )
+        subscribers_count = author.subscribers_count
+        seeded_client.post(f'/api/users/{author.id}/subscribe/')
+        author.refresh_from_db()
+        assert author.subscribers_count == subscribers_count + 1
+        type(recipe).objects.filter(pk=recipe.pk).update(favorites_count=100)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == recipe.favorite.count(), (
+            'Команда reconcile_counters должна исправлять разошедшиеся '
+            'счетчики.'
+        )
+        user.refresh_from_db()
+        assert user.recipes_count == user.recipes.count()
+
+    def test_04_save_keeps_counters(self, seeded_db, seeded_client):
+        recipe_id = seeded_db['recipes'][-1].id
+        author_id = seeded_db['users'][-1].id
+        favorite_url = f'/api/recipes/{recipe_id}/favorite/'
+        subscribe_url = f'/api/users/{author_id}/subscribe/'
+        seeded_client.delete(favorite_url)
+        seeded_client.delete(subscribe_url)
+        recipe = Recipe.objects.get(pk=recipe_id)
+        author = User.objects.get(pk=author_id)
+        seeded_client.post(favorite_url)
+        seeded_client.post(subscribe_url)
+        recipe.name = 'Переименованный рецепт'
+        recipe.save()
+        author.set_password('new-password')
+        author.save()
+        saved_recipe = Recipe.objects.get(pk=recipe_id)
+        saved_author = User.objects.get(pk=author_id)
+        assert saved_recipe.name == recipe.name
+        assert saved_recipe.favorites_count == recipe.favorites_count + 1, (
+            'Сохранение рецепта не должно затирать счетчик избранного, '
+            'измененный после загрузки рецепта.'
+        )
+        assert saved_author.check_password('new-password')
+        assert (
+            saved_author.subscribers_count == author.subscribers_count + 1
+        ), (
+            'Сохранение пользователя не должно затирать счетчик '
+            'подписчиков, измененный после загрузки пользователя.'
+        )
+
+    @pytest.mark.parametrize('url,field', (
+        ('/api/recipes/favorite/', 'favorites_count'),
+        ('/api/recipes/shopping_cart/', 'in_carts_count'),
+    ))
+    def test_04_batch_endpoints(self, seeded_db, seeded_client, url, field,
+                                django_assert_max_num_queries):
+        recipes = seeded_db['recipes']
+        for size in (2, 50):
+            ids = [recipe.id for recipe in recipes[-size:]]
+            seeded_client.delete(url, {'recipes': ids}, format='json')
+            with django_assert_max_num_queries(6):
+                response = seeded_client.post(
+                    url, {'recipes': ids + [999999]}, format='json'
+                )
+            assert response.status_code == HTTPStatus.OK
+            statuses = {item['id']: item['status'] for item in response.json()}
+            assert statuses == {**dict.fromkeys(ids, 'added'),
+                                999999: 'not_found'}, (
+                f'POST-запрос к `{url}` должен возвращать результат по '
+                'каждому рецепту.'
+            )
+            response = seeded_client.post(url, {'recipes': ids},
+                                          format='json')
+            assert {item['status'] for item in response.json()} == {'exists'}
+        recipe = recipes[-1]
+        recipe.refresh_from_db()
+        count = getattr(recipe, field)
+        with django_assert_max_num_queries(5):
+            response = seeded_client.delete(url, {'recipes': ids},
+                                            format='json')
+        assert {item['status'] for item in response.json()} == {'removed'}
+        recipe.refresh_from_db()
+        assert getattr(recipe, field) == count - 1, (
+            f'DELETE-запрос к `{url}` должен уменьшать счетчик `{field}`.'
+        )
+        response = seeded_client.delete(url, {'recipes': ids}, format='json')
+        assert {item['status'] for item in response.json()} == {'absent'}
+        response = seeded_client.post(url, {'recipes': []}, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_04_subscriptions_recipes_limit(self, seeded_client):
+        url = '/api/users/subscriptions/?recipes_limit=2'
+        response = seeded_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        for author in response.json()['results']:
+            assert len(author['recipes']) <= 2, (
+                f'GET-запрос к `{url}` должен возвращать не более '
+                '`recipes_limit` рецептов каждого автора.'
+            )
+            assert author['recipes_count'] > len(author['recipes']), (
+                f'GET-запрос к `{url}` должен возвращать общее количество '
+                'рецептов автора в поле `recipes_count`.'
+            )
+
+    @pytest.mark.parametrize('url', (
+        '/api/users/subscriptions/',
+        '/api/users/subscriptions/?cursor=',
+    ))
+    def test_04_subscriptions_without_authors(self, seeded_db, url):
+        user = User.objects.create_user(
+            username='lonely', email='lonely@example.com',
+            password='password', first_name='Имя', last_name='Фамилия',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url)
+        assert response.status_code == HTTPStatus.OK, (
+            f'GET-запрос к `{url}` пользователя без подписок должен '
+            'вернуть ответ со статусом 200.'
+        )
+        assert response.json()['results'] == []
+
+    @pytest.mark.parametrize('min_subscriptions', (100, 0))
+    def test_04_recipes_feed(self, seeded_db, seeded_client, settings,
+                             min_subscriptions, django_assert_max_num_queries):
+        settings.FEED_TIMELINE_MIN_SUBSCRIPTIONS = min_subscriptions
+        settings.FEED_TIMELINE_SIZE = 150
+        user = seeded_db['user']
+        expected = list(
+            type(seeded_db['recipes'][0]).objects.filter(
+                author__subscribed__user=user
+            ).order_by('-pub_date', '-id').values_list('id', flat=True)
+        )
+        url = '/api/recipes/feed/?limit=100'
+        ids = []
+        while url:
+            with django_assert_max_num_queries(7):
+                response = seeded_client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            data = response.json()
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+        assert ids == expected, (
+            'Лента `/api/recipes/feed/` должна возвращать все рецепты '
+            'авторов, на которых подписан пользователь, от новых к старым.'
+        )
+
+    def test_04_shopping_cart_ingredient_renamed(self, seeded_db,
+                                                 seeded_client):
+        url = '/api/recipes/download_shopping_cart/?format=txt'
+        response = seeded_client.get(url)
+        b''.join(response.streaming_content)
+        ingredient = seeded_db['ingredients'][0].__class__.objects.filter(
+            ingredient_in_recipe__recipe__shopping_cart__user=seeded_db['user']
+        ).first()
+        ingredient.name = 'переименованный ингредиент'
+        ingredient.save()
+        renamed = seeded_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        assert renamed.status_code == HTTPStatus.OK, (
+            f'GET-запрос к `{url}` после переименования ингредиента должен '
+            'вернуть новый файл, а не ответ со статусом 304.'
+        )
+        assert renamed['ETag'] != response['ETag']
+        assert ingredient.name in b''.join(
+            renamed.streaming_content
+        ).decode(), (
+            f'GET-запрос к `{url}` должен возвращать актуальные названия '
+            'ингредиентов.'
+        )
+
+    def test_04_user_version_bumped_after_commit(
+            self, seeded_db, seeded_client,
+            django_capture_on_commit_callbacks):
+        url = '/api/recipes/?is_favorited=1'
+        ids = [recipe.id for recipe in seeded_db['recipes'][-3:]]
+        seeded_client.delete(
+            '/api/recipes/favorite/', {'recipes': ids}, format='json'
+        )
+        with django_capture_on_commit_callbacks() as callbacks:
+            seeded_client.post(
+                '/api/recipes/favorite/', {'recipes': ids}, format='json'
+            )
+            response = seeded_client.get(url)
+        for callback in callbacks:
+            callback()
+        response = seeded_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == HTTPStatus.OK, (
+            f'ETag выдачи `{url}`, вычисленный до фиксации изменений '
+            'избранного, не должен оставаться актуальным после фиксации.'
+        )
+
+    def test_04_feed_timeline_invalidated_after_commit(
+            self, seeded_db, seeded_client, settings,
+            django_capture_on_commit_callbacks):
+        settings.FEED_TIMELINE_MIN_SUBSCRIPTIONS = 0
+        user = seeded_db['user']
+        stale = build_feed_timeline(user)
+        with django_capture_on_commit_callbacks() as callbacks:
+            recipe = Recipe.objects.create(
+                name='Новый рецепт', text='Описание', cooking_time=10,
+                author=user.subscriber.first().author,
+            )
+            get_feed_timeline(user, lambda: stale)
+        for callback in callbacks:
+            callback()
+        response = seeded_client.get('/api/recipes/feed/')
+        assert response.json()['results'][0]['id'] == recipe.id, (
+            'Лента `/api/recipes/feed/`, собранная до фиксации публикации '
+            'рецепта, не должна отдаваться после фиксации.'
+        )
@@ -0,0 +1,249 @@
+import io
+from http import HTTPStatus
+from urllib.parse import urlencode
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+
+from recipes.fts import missing_search_triggers, restore_search_triggers
+from recipes.models import Recipe, Tag
+
+
+@pytest.mark.django_db
+class Test05RecipeFilters:
+
+    def test_05_ingredient_search_ranking(self, seeded_client,
+                                          django_assert_num_queries):
+        url = '/api/ingredients/?name=мук'
+        seeded_client.get(url)
+        with django_assert_num_queries(1):
+            response = seeded_client.get(url)
+        names = [ingredient['name'] for ingredient in response.json()]
+        prefix_count = sum(name.startswith('мук') for name in names)
+        assert names and all(
+            name.startswith('мук') for name in names[:prefix_count]
+        ) and all('мук' in name for name in names[prefix_count:]), (
+            f'GET-запрос к `{url}` должен возвращать сначала ингредиенты, '
+            'название которых начинается с искомой строки, затем '
+            'содержащие ее.'
+        )
+        assert len(names) <= settings.INGREDIENT_SEARCH_LIMIT
+
+    @pytest.mark.parametrize('ordering,field', (
+        ('popular', 'favorites_count'),
+        ('trending', 'trending_score'),
+    ))
+    def test_05_recipes_ordering(self, seeded_db, seeded_client, ordering,
+                                 field):
+        call_command('update_trending_scores', stdout=io.StringIO())
+        url = f'/api/recipes/?ordering={ordering}&limit=20'
+        response = seeded_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        ids = [recipe['id'] for recipe in response.json()['results']]
+        recipes = type(seeded_db['recipes'][0]).objects.in_bulk(ids)
+        scores = [getattr(recipes[pk], field) for pk in ids]
+        assert scores[0] > 0 and scores == sorted(scores, reverse=True), (
+            f'GET-запрос к `{url}` должен возвращать рецепты, '
+            f'отсортированные по убыванию `{field}`.'
+        )
+
+    @pytest.mark.parametrize('url', (
+        '/api/recipes/?ordering=trending',
+        '/api/recipes/?ordering=trending&cursor=',
+    ))
+    def test_05_trending_scores_change_etag(self, seeded_client, url):
+        Recipe.objects.update(trending_score=0)
+        response = seeded_client.get(url)
+        call_command('update_trending_scores', stdout=io.StringIO())
+        assert Recipe.objects.filter(trending_score__gt=0).exists()
+        updated = seeded_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert updated.status_code == HTTPStatus.OK, (
+            f'После пересчета рейтинга популярности GET-запрос к `{url}` '
+            'должен вернуть актуальные данные, а не ответ со статусом 304.'
+        )
+        assert updated['ETag'] != response['ETag']
+
+    def test_05_recipes_search(self, seeded_db, seeded_client):
+        in_text, in_name = seeded_db['recipes'][:2]
+        in_text.text = 'Наваристый борщ со сметаной'
+        in_text.save()
+        in_name.name = 'Борщ по-домашнему'
+        in_name.save()
+        url = '/api/recipes/?search=борщ'
+        response = seeded_client.get(url)
+        assert [recipe['id'] for recipe in response.json()['results']] == [
+            in_name.id, in_text.id
+        ], (
+            f'GET-запрос к `{url}` должен находить рецепты по названию и '
+            'описанию, совпадения в названии - выше.'
+        )
+        params = {'search': 'рецепт 12', 'limit': 7}
+        count = seeded_client.get('/api/recipes/', params).json()['count']
+        ids = []
+        response = seeded_client.get(
+            '/api/recipes/', {**params, 'cursor': ''}
+        ).json()
+        while True:
+            ids.extend(recipe['id'] for recipe in response['results'])
+            if not response['next']:
+                break
+            response = seeded_client.get(response['next']).json()
+        assert count == len(ids) == len(set(ids)) > 0, (
+            'Результаты поиска должны одинаково разбиваться на страницы '
+            'по номеру и курсором.'
+        )
+        for query in ('"', 'NOT (', '*'):
+            response = seeded_client.get('/api/recipes/', {'search': query})
+            assert response.status_code == HTTPStatus.OK
+
+    @pytest.mark.skipif(
+        connection.vendor != 'sqlite',
+        reason='Триггеры полнотекстового индекса есть только на SQLite',
+    )
+    def test_05_search_triggers_restored(self, seeded_db, seeded_client):
+        assert missing_search_triggers() == [], (
+            'После миграций у таблицы FTS5 рецептов должны быть все '
+            'триггеры.'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER recipes_recipe_fts_update')
+        recipe = seeded_db['recipes'][0]
+        Recipe.objects.filter(pk=recipe.pk).update(name='Кулебяка')
+        restore_search_triggers()
+        assert missing_search_triggers() == []
+        response = seeded_client.get('/api/recipes/', {'search': 'кулебяка'})
+        assert [item['id'] for item in response.json()['results']] == [
+            recipe.id
+        ], (
+            'Восстановление триггеров должно перестраивать полнотекстовый '
+            'индекс рецептов.'
+        )
+
+    @pytest.mark.parametrize('mode', ('any', 'all'))
+    def test_05_recipes_tags_filter(self, seeded_db, seeded_client, mode,
+                                    django_assert_num_queries):
+        slugs = ['breakfast', 'lunch']
+        params = {'tags': slugs, 'tags_mode': mode, 'limit': 100}
+        recipes = Recipe.objects.all()
+        if mode == 'all':
+            for slug in slugs:
+                recipes = recipes.filter(tags__slug=slug)
+        else:
+            recipes = recipes.filter(tags__slug__in=slugs).distinct()
+        expected = set(recipes.values_list('id', flat=True))
+        response = seeded_client.get('/api/recipes/', params).json()
+        assert response['count'] == len(expected), (
+            f'Фильтр по тэгам в режиме `{mode}` должен учитывать каждый '
+            'рецепт один раз.'
+        )
+        ids = []
+        url = f'/api/recipes/?{urlencode({**params, "cursor": ""}, True)}'
+        while url:
+            with django_assert_num_queries(5):
+                response = seeded_client.get(url).json()
+            ids.extend(recipe['id'] for recipe in response['results'])
+            url = response['next']
+        assert len(ids) == len(set(ids)) and set(ids) == expected
+        response = seeded_client.get(
+            '/api/recipes/', {**params, 'tags': [*slugs, 'unknown']}
+        ).json()
+        assert response['count'] == (len(expected) if mode == 'any' else 0)
+
+    @pytest.mark.parametrize('create', ('create', 'bulk_create'))
+    def test_05_recipes_new_tag_filter(self, seeded_db, seeded_client,
+                                       create):
+        seeded_client.get('/api/recipes/', {'tags': 'breakfast'})
+        tag = Tag(name='Новый тэг', color='#123456', slug='new-tag')
+        if create == 'create':
+            tag.save()
+        else:
+            Tag.objects.bulk_create([tag])
+            tag = Tag.objects.get(slug='new-tag')
+        recipe = seeded_db['recipes'][0]
+        recipe.tags.add(tag)
+        response = seeded_client.get('/api/recipes/', {'tags': 'new-tag'})
+        assert [item['id'] for item in response.json()['results']] == [
+            recipe.id
+        ], (
+            'Фильтр по тэгам должен находить рецепты по только что '
+            'созданному тэгу.'
+        )
+
+    @pytest.mark.parametrize('ordering,fields', (
+        ('cooking_time', ('cooking_time', 'id')),
+        ('-cooking_time', ('-cooking_time', '-id')),
+        ('name', ('name', 'id')),
+        ('pub_date', ('pub_date', 'id')),
+        ('popular', ('-favorites_count', '-id')),
+    ))
+    def test_05_recipes_cooking_time_and_ordering(self, seeded_db,
+                                                  seeded_client, ordering,
+                                                  fields):
+        params = {
+            'cooking_time_min': 20, 'cooking_time_max': 40,
+            'ordering': ordering, 'limit': 50,
+        }
+        expected = list(Recipe.objects.filter(
+            cooking_time__gte=20, cooking_time__lte=40
+        ).order_by(*fields).values_list('id', flat=True))
+        response = seeded_client.get('/api/recipes/', params).json()
+        assert response['count'] == len(expected)
+        assert [recipe['id'] for recipe in response['results']] == (
+            expected[:50]
+        ), (
+            f'Рецепты должны фильтроваться по времени приготовления и '
+            f'сортироваться по `{ordering}`.'
+        )
+        ids = []
+        url = f'/api/recipes/?{urlencode({**params, "cursor": ""})}'
+        while url:
+            response = seeded_client.get(url).json()
+            ids.extend(recipe['id'] for recipe in response['results'])
+            url = response['next']
+        assert ids == expected
+
+    @pytest.mark.parametrize('ordering,fields', (
+        ('cooking_time', ('cooking_time', 'id')),
+        ('-cooking_time', ('-cooking_time', '-id')),
+    ))
+    def test_05_recipes_cooking_time_ties(self, seeded_db, seeded_client,
+                                          ordering, fields,
+                                          django_assert_max_num_queries):
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe in seeded_db['recipes'][::10]]
+        ).update(cooking_time=5)
+        expected = list(Recipe.objects.filter(
+            cooking_time__lte=5
+        ).order_by(*fields).values_list('id', flat=True))
+        params = {
+            'cooking_time_max': 5, 'ordering': ordering, 'limit': 20,
+            'cursor': '',
+        }
+        url = f'/api/recipes/?{urlencode(params)}'
+        ids = []
+        while url:
+            with django_assert_max_num_queries(6) as captured:
+                response = seeded_client.get(url).json()
+            assert not [
+                query for query in captured.captured_queries
+                if ' OFFSET ' in query['sql']
+            ], (
+                'Страницы рецептов с равным временем приготовления должны '
+                'выбираться условием по курсору, без OFFSET.'
+            )
+            ids.extend(recipe['id'] for recipe in response['results'])
+            url = response['next']
+        assert len(expected) > 300
+        assert ids == expected, (
+            f'Курсорная пагинация с сортировкой `{ordering}` должна '
+            'возвращать все рецепты с равным временем приготовления '
+            'по одному разу.'
+        )
+
+    def test_05_recipes_cooking_time_invalid(self, seeded_client):
+        response = seeded_client.get('/api/recipes/',
+                                     {'cooking_time_max': 'быстро'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'cooking_time_max' in response.json()
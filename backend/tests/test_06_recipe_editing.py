@@ -0,0 +1,99 @@
+from http import HTTPStatus
+
+import pytest
+
+from recipes.models import Recipe
+from tests.utils import recipe_payload
+
+
+@pytest.mark.django_db
+class Test06RecipeEditing:
+
+    def test_06_recipe_update_diffs_ingredients(self, seeded_db,
+                                                seeded_client, settings,
+                                                tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        payload = recipe_payload(seeded_db, 'Рецепт для изменения')
+        response = seeded_client.post('/api/recipes/', data=payload,
+                                      format='json')
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        rows = dict(recipe.ingredient_in_recipe.values_list(
+            'ingredient_id', 'id'
+        ))
+        ingredients = seeded_db['ingredients']
+        payload['ingredients'] = [
+            {'id': ingredients[0].id, 'amount': 20},
+            *payload['ingredients'][1:5],
+            {'id': ingredients[6].id, 'amount': 5},
+        ]
+        payload['tags'] = [seeded_db['tags'][1].id, seeded_db['tags'][2].id]
+        url = f'/api/recipes/{recipe.id}/'
+        response = seeded_client.patch(url, data=payload, format='json')
+        assert response.status_code == HTTPStatus.OK
+        updated = {
+            ingredient_id: (row_id, amount)
+            for ingredient_id, row_id, amount in
+            recipe.ingredient_in_recipe.values_list(
+                'ingredient_id', 'id', 'amount'
+            )
+        }
+        assert set(updated) == {
+            ingredient['id'] for ingredient in payload['ingredients']
+        }
+        assert updated[ingredients[0].id] == (rows[ingredients[0].id], 20)
+        for ingredient in ingredients[1:5]:
+            assert updated[ingredient.id][0] == rows[ingredient.id], (
+                f'PATCH-запрос к `{url}` не должен пересоздавать '
+                'неизменившиеся ингредиенты рецепта.'
+            )
+        assert {tag['id'] for tag in response.json()['tags']} == set(
+            payload['tags']
+        )
+        assert {
+            ingredient['id']: ingredient['amount']
+            for ingredient in response.json()['ingredients']
+        } == {
+            ingredient['id']: ingredient['amount']
+            for ingredient in payload['ingredients']
+        }
+
+    def test_06_recipe_create_duplicate_ingredients(self, seeded_db,
+                                                    seeded_client):
+        payload = recipe_payload(seeded_db, 'Рецепт с повторами')
+        payload['ingredients'].append(
+            {'id': payload['ingredients'][0]['id'], 'amount': 5}
+        )
+        response = seeded_client.post('/api/recipes/', data=payload,
+                                      format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            'POST-запрос к `/api/recipes/` с повторяющимся ингредиентом '
+            'должен вернуть ответ со статусом 400.'
+        )
+        assert 'ingredients' in response.json()
+        assert not Recipe.objects.filter(name=payload['name']).exists()
+
+    def test_06_recipe_update_duplicate_ingredients(self, seeded_db,
+                                                    seeded_client, settings,
+                                                    tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        payload = recipe_payload(seeded_db, 'Рецепт для повторов')
+        response = seeded_client.post('/api/recipes/', data=payload,
+                                      format='json')
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        expected = set(recipe.ingredient_in_recipe.values_list(
+            'ingredient_id', 'amount'
+        ))
+        payload['ingredients'] = [
+            {'id': payload['ingredients'][0]['id'], 'amount': 20},
+            *payload['ingredients'],
+        ]
+        url = f'/api/recipes/{recipe.id}/'
+        response = seeded_client.patch(url, data=payload, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            f'PATCH-запрос к `{url}` с повторяющимся ингредиентом должен '
+            'вернуть ответ со статусом 400, как и при создании рецепта.'
+        )
+        assert 'ingredients' in response.json()
+        assert set(recipe.ingredient_in_recipe.values_list(
+            'ingredient_id', 'amount'
+        )) == expected
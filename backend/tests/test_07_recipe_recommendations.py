@@ -0,0 +1,253 @@
+import io
+from datetime import timedelta
+from http import HTTPStatus
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.cache import RECIPE_INGREDIENTS_VERSION, bump_version
+from api.search import recipe_ingredient_index
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+from recipes.similarity import RecipeVectors, update_similar_recipes
+from tests.utils import recipe_payload
+
+
+def expected_by_ingredients(have, limit):
+    compositions = {}
+    for recipe_id, ingredient_id in IngredientInRecipe.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ):
+        compositions.setdefault(recipe_id, set()).add(ingredient_id)
+    ranked = sorted(
+        (
+            (recipe_id, len(ingredients & have), len(ingredients - have))
+            for recipe_id, ingredients in compositions.items()
+            if ingredients & have
+        ),
+        key=lambda item: (-item[1], item[2], -item[0])
+    )
+    return len(ranked), ranked[:limit]
+
+
+def found_by_ingredients(client, params):
+    response = client.get('/api/recipes/by_ingredients/', params)
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    return data['count'], [
+        (recipe['id'], recipe['matched_ingredients'],
+         recipe['missing_ingredients'])
+        for recipe in data['results']
+    ]
+
+
+@pytest.mark.django_db
+class Test07RecipeRecommendations:
+
+    def test_07_recipes_by_ingredients(self, seeded_db, seeded_client,
+                                       settings, tmp_path,
+                                       django_assert_num_queries):
+        settings.MEDIA_ROOT = tmp_path
+        have = {ingredient.id for ingredient in seeded_db['ingredients'][:6]}
+        have.update(seeded_db['recipes'][0].ingredient_in_recipe.values_list(
+            'ingredient_id', flat=True
+        ))
+        params = {'have': ','.join(map(str, have)), 'limit': 50}
+
+        def expected():
+            return expected_by_ingredients(have, params['limit'])
+
+        def found():
+            return found_by_ingredients(seeded_client, params)
+
+        assert found() == expected(), (
+            'Рецепты должны сортироваться по убыванию имеющихся и '
+            'возрастанию недостающих ингредиентов.'
+        )
+        with django_assert_num_queries(5):
+            found()
+        response = seeded_client.post(
+            '/api/recipes/',
+            data=recipe_payload(seeded_db, 'Из того, что есть'),
+            format='json'
+        )
+        recipe_id = response.json()['id']
+        bump_version(RECIPE_INGREDIENTS_VERSION)
+        count, ranked = found()
+        assert (count, ranked) == expected()
+        assert ranked[0] == (recipe_id, 6, 0), (
+            'Индекс должен обновляться после изменения рецептов.'
+        )
+        Recipe.objects.filter(pk=recipe_id).delete()
+        bump_version(RECIPE_INGREDIENTS_VERSION)
+        assert found() == expected()
+
+    def test_07_by_ingredients_delete_and_add(self, seeded_db,
+                                              seeded_client, settings,
+                                              tmp_path, monkeypatch):
+        settings.MEDIA_ROOT = tmp_path
+        deleted = seeded_db['recipes'][0]
+        have = set(deleted.ingredient_in_recipe.values_list(
+            'ingredient_id', flat=True
+        ))
+        params = {'have': ','.join(map(str, have)), 'limit': 50}
+        found_by_ingredients(seeded_client, params)
+        builds = []
+        monkeypatch.setattr(
+            recipe_ingredient_index, '_build',
+            lambda version: builds.append(version)
+        )
+        Recipe.objects.filter(pk=deleted.pk).delete()
+        seeded_client.post(
+            '/api/recipes/',
+            data=recipe_payload(seeded_db, 'Вместо удаленного'),
+            format='json'
+        )
+        Recipe.objects.create(
+            name='Без ингредиентов', text='Описание', cooking_time=5,
+            author=seeded_db['user'],
+        )
+        for _ in range(2):
+            bump_version(RECIPE_INGREDIENTS_VERSION)
+            count, ranked = found_by_ingredients(seeded_client, params)
+            assert (count, ranked) == expected_by_ingredients(
+                have, params['limit']
+            ), (
+                'Индекс должен учитывать удаление одного рецепта и '
+                'добавление другого между обновлениями.'
+            )
+        assert deleted.pk not in {recipe_id for recipe_id, *_ in ranked}
+        assert not builds, (
+            'Индекс должен обновляться инкрементально, без полной '
+            'перестройки из-за рецептов без ингредиентов.'
+        )
+
+    def test_07_by_ingredients_ingredient_deleted(self, seeded_db,
+                                                  seeded_client):
+        recipe = seeded_db['recipes'][0]
+        *have, deleted = recipe.ingredient_in_recipe.order_by(
+            'ingredient_id'
+        ).values_list('ingredient_id', flat=True)
+        have = set(have)
+        params = {'have': ','.join(map(str, have)), 'limit': 50}
+        Recipe.objects.update(updated_at=timezone.now())
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        found_by_ingredients(seeded_client, params)
+        Ingredient.objects.filter(pk=deleted).delete()
+        bump_version(RECIPE_INGREDIENTS_VERSION)
+        assert found_by_ingredients(seeded_client, params) == (
+            expected_by_ingredients(have, params['limit'])
+        ), (
+            'Индекс должен учитывать ингредиенты рецептов, удаленные '
+            'вместе с ингредиентом.'
+        )
+
+    @pytest.mark.parametrize('have', ('', 'мука', '1,,x', ','.join(
+        map(str, range(1, settings.HAVE_INGREDIENTS_MAX + 2))
+    )))
+    def test_07_recipes_by_ingredients_invalid(self, seeded_client, have):
+        response = seeded_client.get('/api/recipes/by_ingredients/',
+                                     {'have': have})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'have' in response.json()
+
+    def test_07_similar_recipes(self, seeded_db, seeded_client, settings,
+                                tmp_path, django_assert_num_queries):
+        settings.MEDIA_ROOT = tmp_path
+        recipe = seeded_db['recipes'][0]
+        call_command('update_similar_recipes', stdout=io.StringIO())
+        compositions = {}
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            compositions.setdefault(recipe_id, set()).add(ingredient_id)
+        tags = {}
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ):
+            tags.setdefault(recipe_id, set()).add(tag_id)
+        weight = settings.SIMILAR_RECIPES_TAG_WEIGHT ** 2
+
+        def score(first, second):
+            return (
+                len(compositions[first] & compositions[second])
+                + weight * len(tags[first] & tags[second])
+            ) / (
+                (len(compositions[first]) + weight * len(tags[first]))
+                * (len(compositions[second]) + weight * len(tags[second]))
+            ) ** 0.5
+
+        expected = sorted(
+            (
+                other_id for other_id in compositions
+                if other_id != recipe.id
+                and compositions[other_id] & compositions[recipe.id]
+            ),
+            key=lambda other_id: (-score(recipe.id, other_id), -other_id)
+        )[:settings.SIMILAR_RECIPES_LIMIT]
+        url = f'/api/recipes/{recipe.id}/similar/'
+        with django_assert_num_queries(2):
+            response = seeded_client.get(url)
+        assert [item['id'] for item in response.json()] == expected, (
+            f'GET-запрос к `{url}` должен возвращать самые похожие рецепты '
+            'по убыванию сходства.'
+        )
+        payload = recipe_payload(seeded_db, 'Копия рецепта')
+        payload['ingredients'] = [
+            {'id': ingredient_id, 'amount': 1}
+            for ingredient_id in compositions[recipe.id]
+        ]
+        payload['tags'] = list(tags[recipe.id])
+        copy_id = seeded_client.post(
+            '/api/recipes/', data=payload, format='json'
+        ).json()['id']
+        call_command('update_similar_recipes', incremental=True,
+                     stdout=io.StringIO())
+        similar = [item['id'] for item in seeded_client.get(url).json()]
+        assert similar == [copy_id, *expected[:-1]], (
+            'Инкрементальный пересчет должен учитывать новые рецепты в '
+            'списках похожих.'
+        )
+        response = seeded_client.get(f'/api/recipes/{copy_id}/similar/')
+        assert response.json()[0]['id'] == recipe.id
+        assert seeded_client.get(
+            '/api/recipes/0/similar/'
+        ).status_code == HTTPStatus.NOT_FOUND
+
+    def test_07_similar_recipes_incremental_skips_unchanged(self, seeded_db):
+        assert update_similar_recipes() == len(seeded_db['recipes'])
+        assert update_similar_recipes(incremental=True) == 0, (
+            'Инкрементальный пересчет без изменений не должен '
+            'пересчитывать рецепты.'
+        )
+        Recipe.objects.create(
+            name='Без ингредиентов', text='Описание', cooking_time=5,
+            author=seeded_db['user'],
+        )
+        assert update_similar_recipes(incremental=True) == 1
+        assert update_similar_recipes(incremental=True) == 0, (
+            'Рецепты без похожих не должны пересчитываться при каждом '
+            'инкрементальном пересчете.'
+        )
+
+    def test_07_similar_recipes_candidates_bounded(self, seeded_db,
+                                                   settings):
+        settings.SIMILAR_RECIPES_MAX_CANDIDATES = 10
+        vectors = RecipeVectors()
+        for recipe in seeded_db['recipes'][:50]:
+            rarest = min(
+                vectors.ingredients[recipe.id],
+                key=lambda ingredient_id: len(vectors.postings[ingredient_id])
+            )
+            candidates = vectors.candidates(recipe.id)
+            assert set(vectors.postings[rarest]) - {recipe.id} <= candidates
+            assert len(candidates) <= max(
+                settings.SIMILAR_RECIPES_MAX_CANDIDATES,
+                len(vectors.postings[rarest])
+            ), (
+                'Кандидаты в похожие рецепты должны ограничиваться '
+                'SIMILAR_RECIPES_MAX_CANDIDATES.'
+            )
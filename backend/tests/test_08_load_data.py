@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import os
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+
+from recipes.management.commands import loadcsv
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+from users.models import User
+
+DATA_DIR = os.path.join(os.path.dirname(settings.BASE_DIR), 'data')
+INGREDIENTS_JSON = os.path.join(DATA_DIR, 'ingredients.json')
+INGREDIENTS_CSV = os.path.join(DATA_DIR, 'ingredients.csv')
+
+
+def load(path, *args):
+    call_command(
+        'loadcsv', '--path', path, '--app', 'recipes', '--model',
+        'ingredient', *args, stdout=io.StringIO()
+    )
+
+
+def ingredients():
+    return set(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+
+@pytest.mark.django_db
+class Test08LoadData:
+
+    def test_08_load_json(self, monkeypatch):
+        monkeypatch.setattr(loadcsv, 'JSON_CHUNK_SIZE', 100)
+        with open(INGREDIENTS_JSON, encoding='utf-8') as file:
+            expected = {
+                (row['name'], row['measurement_unit'])
+                for row in json.load(file)
+            }
+        load(INGREDIENTS_JSON, '--batch-size', '500')
+        assert Ingredient.objects.count() == len(expected)
+        assert ingredients() == expected, (
+            'Команда loadcsv должна загружать все ингредиенты из json, '
+            'читая файл частями.'
+        )
+
+    def test_08_load_csv_without_header(self):
+        with open(INGREDIENTS_CSV, encoding='utf-8') as file:
+            expected = {tuple(row) for row in csv.reader(file)}
+        load(INGREDIENTS_CSV, '--fields', 'name', 'measurement_unit')
+        assert ingredients() == expected, (
+            'Команда loadcsv должна загружать csv без заголовка по полям '
+            'из параметра --fields.'
+        )
+
+    def test_08_reload_keeps_rows(self):
+        load(INGREDIENTS_JSON)
+        count = Ingredient.objects.count()
+        ingredient = Ingredient.objects.order_by('id').first()
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия',
+        )
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10, author=author
+        )
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=100
+        )
+        load(INGREDIENTS_JSON)
+        load(INGREDIENTS_CSV, '--fields', 'name', 'measurement_unit')
+        assert Ingredient.objects.count() == count, (
+            'Повторная загрузка не должна дублировать ингредиенты.'
+        )
+        assert Ingredient.objects.filter(pk=ingredient.pk).exists()
+        assert IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredient=ingredient
+        ).exists(), (
+            'Повторная загрузка не должна удалять ингредиенты рецептов.'
+        )
+
+    def test_08_reload_updates_fields(self, tmp_path):
+        load(INGREDIENTS_CSV, '--fields', 'name', 'measurement_unit')
+        ingredient = Ingredient.objects.order_by('id').first()
+        path = tmp_path / 'ingredients.csv'
+        path.write_text(
+            f'name,measurement_unit\n{ingredient.name},щепотка\n',
+            encoding='utf-8'
+        )
+        load(str(path), '--unique-fields', 'name')
+        ingredient.refresh_from_db()
+        assert ingredient.measurement_unit == 'щепотка', (
+            'Загрузка должна обновлять поля, не входящие в естественный '
+            'ключ, у найденных по нему объектов.'
+        )
+        assert Ingredient.objects.filter(name=ingredient.name).count() == 1
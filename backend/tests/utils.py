@@ -84,3 +84,22 @@ invalid_registration_data_fields = [
         ),)
     )
 ]
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+def recipe_payload(seeded_db, name):
+    return {
+        'name': name,
+        'text': 'Описание рецепта',
+        'cooking_time': 15,
+        'image': IMAGE,
+        'tags': [tag.id for tag in seeded_db['tags'][:2]],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in seeded_db['ingredients'][:6]
+        ],
+    }
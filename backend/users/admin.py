@@ -31,7 +31,7 @@ class CustomUserAdmin(UserAdmin):
     )
     list_display = (
         'username', 'first_name', 'last_name', 'email', 'is_active',
-        'is_staff',
+        'is_staff', 'recipes_count', 'subscribers_count',
     )
     fields = (
         ('is_active', 'is_staff',),
@@ -1,8 +1,30 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Value
 
+from recipes.managers import RelationManager
+from recipes.mixins import CounterFieldsMixin
 
-class User(AbstractUser):
+
+class UserQuerySet(models.QuerySet):
+    """Выборки пользователей для выдачи через API."""
+
+    def with_subscription(self, user):
+        """Аннотирование признака подписки пользователя user на авторов."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(is_subscribed=Exists(Subscribe.objects.filter(
+            user=user, author=OuterRef('pk')
+        )))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с дополнительными выборками."""
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Класс для создания модели пользователя."""
 
     first_name = models.CharField(
@@ -21,9 +43,25 @@ class User(AbstractUser):
         unique=True,
     )
 
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     REQUIRED_FIELDS = ('first_name', 'last_name')
     USERNAME_FIELDS = 'email'
 
+    objects = CustomUserManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -44,6 +82,8 @@ class Subscribe(models.Model):
         verbose_name='Автор',
     )
 
+    objects = RelationManager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'